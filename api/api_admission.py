@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+"""
+This module provides admission control for the WAMP/WebSocket interface's RPC
+procedures, so that a flood of invocations cannot pile unbounded work onto
+the rest of the system or starve the invocations of privileged roles.
+
+The number of invocations in progress (in flight) is limited per caller
+session, per caller role and globally (see the ADMISSION setting in the
+api_rpc_config.py module); a session's limit also counts its waiting
+invocations, so that a single session cannot fill the queue. An invocation
+beyond a session or role limit fails immediately. An invocation beyond the
+global limit waits in a bounded queue, in which the invocations of priority
+roles (ex. "ljadmin") are admitted first and may displace those of other
+roles; it fails if the queue is full or if it is not admitted in time.
+Invocations fail with a "com.lojack.rtu.error.overloaded" error.
+
+Exports:
+    AdmissionControl
+        Limits the invocations in progress, admitting them by priority.
+"""
+
+from __future__ import unicode_literals
+
+# System modules.
+import heapq
+import itertools
+
+# WAMP-related modules.
+from autobahn.wamp.exception import ApplicationError
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, fail, succeed
+
+
+# Error with which invocations that are not admitted fail.
+ERROR_OVERLOADED = "com.lojack.rtu.error.overloaded"
+
+
+class AdmissionControl(object):
+
+    """
+    Limits the invocations in progress per session, per role and globally,
+    admitting them by priority (see the module documentation). Each admitted
+    invocation must be released once it completes.
+    """
+
+    def __init__(
+            self,
+            in_flight,
+            in_flight_role,
+            in_flight_session,
+            queue_size,
+            queue_timeout,
+            priority_roles):
+        self.in_flight = in_flight
+        self.in_flight_role = in_flight_role
+        self.in_flight_session = in_flight_session
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.priority_roles = priority_roles
+        self.admitted = 0
+        self.rejected = 0
+        self._in_flight = 0
+        self._in_flight_by_role = {}
+        self._in_flight_by_session = {}
+        # Invocations waiting to be admitted: a heap of [priority, sequence
+        # number, session, role, Deferred, timer] entries (the lowest
+        # priority value is admitted first). Entries that were removed
+        # otherwise are marked by a None Deferred.
+        self._queue = []
+        self._queued = 0
+        self._queued_by_session = {}
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return self._in_flight
+
+    def queued(self):
+        return self._queued
+
+    def _overloaded(self, message):
+        self.rejected += 1
+        return ApplicationError(ERROR_OVERLOADED, message)
+
+    def _acquire(self, session, role):
+        self._in_flight += 1
+        self._in_flight_by_role[role] = \
+            self._in_flight_by_role.get(role, 0) + 1
+        self._in_flight_by_session[session] = \
+            self._in_flight_by_session.get(session, 0) + 1
+        self.admitted += 1
+        return (session, role)
+
+    def admit(self, session, role):
+        """
+        Admit an invocation by the specified caller session and role. Returns
+        a Deferred that fires with a token (to be released) once the
+        invocation is admitted, or fails if it is not. Cancelling the
+        Deferred withdraws a waiting invocation.
+        """
+        if session is not None and \
+           self._in_flight_by_session.get(session, 0) + \
+           self._queued_by_session.get(session, 0) >= \
+               self.in_flight_session:
+            return fail(
+                       self._overloaded(
+                           "Too many invocations in progress or waiting for "
+                               "the session ({})".format(
+                                   self.in_flight_session)))
+        role_limit = self.in_flight_role.get(role)
+        if role_limit is not None and \
+           self._in_flight_by_role.get(role, 0) >= role_limit:
+            return fail(
+                       self._overloaded(
+                           "Too many invocations in progress for role "
+                               "'{}' ({})".format(
+                                   role,
+                                   role_limit)))
+        priority = 0 if role in self.priority_roles else 1
+        if self._in_flight < self.in_flight and self._queued == 0:
+            return succeed(self._acquire(session, role))
+        if self._queued >= self.queue_size and \
+           not self._displace(priority):
+            return fail(
+                       self._overloaded(
+                           "Too many invocations in progress ({}) and "
+                               "waiting ({})".format(
+                                   self.in_flight,
+                                   self.queue_size)))
+        entry = [priority, next(self._sequence), session, role, None, None]
+        d = Deferred(lambda d: self._cancel(entry))
+        entry[4] = d
+        entry[5] = reactor.callLater(self.queue_timeout, self._expire, entry)
+        heapq.heappush(self._queue, entry)
+        self._queued += 1
+        self._queued_by_session[session] = \
+            self._queued_by_session.get(session, 0) + 1
+        return d
+
+    def _displace(self, priority):
+        """
+        Make room in the queue for an invocation of the specified priority by
+        failing the most recently queued invocation of a lower priority, if
+        any. Returns whether room was made.
+        """
+        displaced = None
+        for entry in self._queue:
+            if entry[4] is not None and \
+               entry[0] > priority and \
+               (displaced is None or entry[1] > displaced[1]):
+                displaced = entry
+        if displaced is None:
+            return False
+        self._remove(displaced).errback(
+            self._overloaded(
+                "Displaced by an invocation of a higher priority"))
+        return True
+
+    def _remove(self, entry):
+        d, entry[4] = entry[4], None
+        if entry[5].active():
+            entry[5].cancel()
+        self._queued -= 1
+        self._queued_by_session[entry[2]] -= 1
+        if self._queued_by_session[entry[2]] == 0:
+            del self._queued_by_session[entry[2]]
+        return d
+
+    def _cancel(self, entry):
+        # The waiting invocation was cancelled (ex. its caller left); its
+        # Deferred fails with a CancelledError.
+        if entry[4] is not None:
+            self._remove(entry)
+
+    def _expire(self, entry):
+        if entry[4] is not None:
+            self._remove(entry).errback(
+                self._overloaded(
+                    "Not admitted within {} seconds".format(
+                        self.queue_timeout)))
+
+    def release(self, token):
+        """
+        Release the specified admitted invocation (a token returned by
+        admit), admitting waiting invocations in its place.
+        """
+        session, role = token
+        self._in_flight -= 1
+        self._in_flight_by_role[role] -= 1
+        if self._in_flight_by_role[role] == 0:
+            del self._in_flight_by_role[role]
+        self._in_flight_by_session[session] -= 1
+        if self._in_flight_by_session[session] == 0:
+            del self._in_flight_by_session[session]
+        while self._queue and self._in_flight < self.in_flight:
+            entry = heapq.heappop(self._queue)
+            if entry[4] is not None:
+                self._remove(entry).callback(
+                    self._acquire(entry[2], entry[3]))
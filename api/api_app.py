@@ -9,14 +9,42 @@ Exports:
         WAMP/WebSocket interface application component class.
 """
 
+# System modules.
+import logging
+
 # WAMP-related modules.
 from autobahn.twisted.wamp import ApplicationSession
 from autobahn.wamp.exception import ApplicationError
-from autobahn.wamp.types import RegisterOptions
-from twisted.internet.defer import inlineCallbacks
+from autobahn.wamp.types import CallOptions, SubscribeOptions
+from twisted.internet.defer import \
+    DeferredList, inlineCallbacks, maybeDeferred
+from twisted.internet.task import LoopingCall
 
 # Local modules.
+import api_admission
+import api_changes
+import api_ipc
+import api_metrics
 import api_rpc
+import api_rpc_config
+import api_slots
+import api_worker
+
+
+# Log the WAMP/WebSocket interface's messages to the WAMP router's log.
+logging.basicConfig(
+    level = api_rpc_config.LOG_LEVEL,
+    format = "%(name)s %(levelname)s: %(message)s")
+
+log = logging.getLogger(__name__)
+
+
+# Metrics Procedure URI; invoked in the WAMP router, which collects the
+# workers' metrics (see api_worker.py module).
+PROC_URI_METRICS = ".".join([api_rpc_config.PROC_URI_PREFIX, "v1", "metrics"])
+
+# Update Procedure URI.
+PROC_URI_UPDATE = ".".join([api_rpc_config.PROC_URI_PREFIX, "v1", "update"])
 
 
 class Application(ApplicationSession):
@@ -24,6 +52,8 @@ class Application(ApplicationSession):
     """
     Extend the WAMP application component class to register the application's
     RPC procedures with the WAMP router that instantiated the class/component.
+    Invocations are forwarded to the worker processes, if any (see
+    api_worker.py module).
     """
 
     @inlineCallbacks
@@ -32,29 +62,228 @@ class Application(ApplicationSession):
         Invoked after the WAMP router starts the application component and
         joins the component to its configured realm.
         """
-        # Register each configured application WAMP RPC procedure.
-        # (see api_rpc.py and api_rpc_config.py modules).
-        for proc in api_rpc.PROCS:
-            try:
-                # Each procedure registration must specify a reference to the
-                # procedure and the URI that will be used to invoke it. All
-                # procedures are registered with the ability to return
-                # in-progress results in addition to a final result.
-                reg = yield self.register(
-                                proc["proc"],
-                                proc["uri"],
-                                RegisterOptions(details_arg = "details"))
-                print(
-                    "Registered procedure {} for URI '{}' with ID {}".format(
-                        proc["proc"],
-                        proc["uri"],
-                        reg.id))
-            except Exception as e:
-                raise ApplicationError(
-                          "com.lojack.rtu.error.register_proc",
-                          "Could not register procedure {} "
-                              "for URI '{}': {}".format(
-                                  proc["proc"],
-                                  proc["uri"],
-                                  str(e)))
+        # Open the shared connection to the internal IPC interface used by
+        # the data procedures (see api_ipc.py module).
+        api_ipc.start()
+        # Discard cached results as the rest of the system notifies changes
+        # to their data, and publish the changes (see api_changes.py
+        # module).
+        api_ipc.listen(lambda data_uri, result: api_rpc.invalidate(data_uri))
+        self._changes = \
+            api_changes.ChangePublisher(
+                self.publish,
+                api_changes.get_published_resources())
+        api_ipc.listen(self._changes.receive)
+        # Track the invocations in progress by caller session ID, to cancel
+        # them if the caller leaves.
+        self._calls = {}
+        self._admission = \
+            api_admission.AdmissionControl(**api_rpc_config.ADMISSION)
+        api_metrics.register_gauge(
+            "rpc.admission",
+            lambda: {
+                "in_flight": len(self._admission),
+                "queued": self._admission.queued(),
+                "admitted": self._admission.admitted,
+                "rejected": self._admission.rejected})
+        yield self.subscribe(
+                  self._session_left,
+                  "wamp.metaevent.session.on_leave")
+        # Track the worker processes as they announce themselves, and ask
+        # those already running (ex. if this component was restarted) to
+        # announce themselves again.
+        self._workers = api_worker.Workers(api_rpc_config.WORKER_POLICY)
+        yield self.subscribe(
+                  self._worker_ready,
+                  api_worker.TOPIC_URI_READY,
+                  options = SubscribeOptions(details_arg = "details"))
+        self.publish(api_worker.TOPIC_URI_DISCOVER)
+        # Report the problems in the data procedure configuration now,
+        # rather than when the data procedures are invoked.
+        for problem in api_rpc.preload():
+            log.warning("%s", problem)
+        # Register each configured application WAMP RPC procedure
+        # (see api_rpc.py and api_rpc_config.py modules). All procedures are
+        # registered with the ability to return in-progress results in
+        # addition to a final result, and with the caller's session ID and
+        # role (for admission control) and transport (for the formats of
+        # the results, see api_slots.py module) disclosed.
+        registrations = \
+            yield api_rpc.register(
+                      self,
+                      [(proc["uri"], self._make_proc(proc))
+                           for proc in api_rpc.PROCS],
+                      {"details_arg": "details",
+                       "discloseCaller": True,
+                       "discloseCallerTransport": True},
+                      api_rpc_config.PROC_URI_PREFIX)
+        for uri, reg in registrations:
+            print(
+                "Registered procedure for URI '{}' with ID {}".format(
+                    uri,
+                    reg.id))
+        # Publish the metrics periodically (see api_metrics.py module).
+        self._metrics_publisher = LoopingCall(self._publish_metrics)
+        self._metrics_publisher.start(
+            api_rpc_config.METRICS_INTERVAL,
+            now = False)
+
+    def _worker_ready(self, worker_id, details = None):
+        # A worker may only announce itself (see api_worker.py module).
+        if details is None or details.publisher != worker_id:
+            log.warning(
+                "Ignoring announcement of worker %s by session %s",
+                worker_id,
+                details.publisher if details is not None else None)
+            return
+        self._workers.add(worker_id)
+
+    def _session_left(self, session_details):
+        # Cancel the invocations of the caller that left, since nobody awaits
+        # their results (and any pending IPC requests they made), both here
+        # and in the workers they were forwarded to.
+        calls = list(self._calls.pop(session_details["session"], ()))
+        for d in calls:
+            d.cancel()
+        if len(calls) > 0:
+            for worker_id in self._workers:
+                self.call(
+                    api_worker.cancel_uri(worker_id),
+                    session_details["session"]).addErrback(
+                        lambda failure: None)
+
+    def _make_proc(self, proc):
+        """
+        Return a procedure admitting invocations of the specified RPC
+        procedure and forwarding them to a worker.
+        """
+        def _proc_forwarded(data, details = None):
+            caller = details.caller if details is not None else None
+            # Only here is the caller's transport known (the workers are
+            # invoked by this component).
+            api_slots.check_format(
+                data,
+                details.caller_transport if details is not None else None)
+            d = self._admission.admit(
+                    caller,
+                    details.authrole
+                        if details is not None
+                        else None).addCallback(
+                        self._invoke,
+                        proc,
+                        data,
+                        details)
+            if caller is not None:
+                calls = self._calls.setdefault(caller, set())
+                calls.add(d)
+
+                def completed(result):
+                    calls.discard(d)
+                    return result
+
+                d.addBoth(completed)
+            return d
+        return _proc_forwarded
+
+    def _invoke(self, token, proc, data, details):
+        """
+        Invoke the specified RPC procedure, once admitted; the invocation is
+        released once it completes.
+        """
+        def release(result):
+            self._admission.release(token)
+            return result
+        return maybeDeferred(
+                   self._forward,
+                   proc,
+                   data,
+                   details).addBoth(release)
+
+    def _forward(self, proc, data, details):
+        """
+        Forward an invocation of the specified RPC procedure to the next
+        worker, or invoke it here if there are no workers. Returns a Deferred
+        that fires with the result; in-progress results are passed on.
+        """
+        if proc["uri"] == PROC_URI_METRICS:
+            return self._collect_metrics(proc, data)
+        # Updates of a data URI are all forwarded to the same worker, so
+        # that they can be coalesced (see api_coalesce.py module).
+        worker_id = \
+            self._workers.choose(
+                data.get("uri")
+                    if proc["uri"] == PROC_URI_UPDATE and
+                       isinstance(data, dict)
+                    else None)
+        if worker_id is None:
+            return proc["proc"](data, details)
+
+        def forward_failed(failure):
+            # The worker has left; forget it and forward the invocation to
+            # another one.
+            if isinstance(failure.value, ApplicationError) and \
+               failure.value.error == ApplicationError.NO_SUCH_PROCEDURE:
+                self._workers.remove(worker_id)
+                return self._forward(proc, data, details)
+            return failure
 
+        # The worker enforces the invocation's deadline itself; the timeout
+        # here also covers a worker that does not respond at all.
+        return api_rpc.set_timeout(
+                   self.call(
+                       api_worker.proc_uri(worker_id, proc["uri"]),
+                       data,
+                       caller = \
+                           details.caller if details is not None else None,
+                       options = CallOptions(
+                                     onProgress = \
+                                         details.progress
+                                             if details is not None
+                                             else None)),
+                   api_rpc.get_timeout(proc["uri"], data),
+                   proc["uri"]).addErrback(
+                       forward_failed)
+
+    def _collect_metrics(self, proc, data):
+        """
+        Return a Deferred that fires with the metrics of the WAMP router's
+        process (ex. admission control), with those of each worker by worker
+        ID under "workers".
+        """
+        worker_ids = list(self._workers)
+
+        def collected(results):
+            metrics = results[0][1]
+            metrics["workers"] = dict(
+                (str(worker_id), worker_metrics)
+                    for worker_id, (success, worker_metrics) in zip(
+                        worker_ids,
+                        results[1:])
+                        if success)
+            return metrics
+
+        return DeferredList(
+                   [proc["proc"](data, None)] +
+                   [self.call(
+                        api_worker.proc_uri(worker_id, proc["uri"]),
+                        data)
+                        for worker_id in worker_ids],
+                   consumeErrors = True).addCallback(collected)
+
+    def _publish_metrics(self):
+        proc = {
+            "proc": api_rpc.v1_metrics,
+            "uri": PROC_URI_METRICS}
+        self._collect_metrics(proc, {}).addCallback(
+            lambda metrics: self.publish(
+                                api_rpc_config.METRICS_TOPIC_URI,
+                                metrics))
+
+    def onLeave(self, details):
+        """
+        Invoked when the application component leaves its realm.
+        """
+        if hasattr(self, "_metrics_publisher") and \
+           self._metrics_publisher.running:
+            self._metrics_publisher.stop()
+        ApplicationSession.onLeave(self, details)
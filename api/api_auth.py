@@ -11,15 +11,45 @@ Exports:
         WAMP router authentication component class.
 """
 
+# System modules.
+import hashlib
+
 # WAMP-related modules.
 from autobahn.twisted.wamp import ApplicationSession
 from autobahn.wamp.exception import ApplicationError
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet import reactor
+from twisted.internet.defer import fail, inlineCallbacks
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+# Local modules.
+import api_cache
 
 
 # Authentication Procedure URI.
 PROC_URI = "com.lojack.wamp.proc.v1.authenticate"
 
+# Maximum number of threads checking credentials, and of credential checks
+# waiting for a thread; authentications beyond these fail immediately.
+THREADS = 4
+THREADS_QUEUE_SIZE = 1000
+
+# Maximum number of recent authentications remembered, and the time (in
+# seconds) for which successful and failed authentications are remembered.
+CACHE_SIZE = 10000
+CACHE_TTL = 300.0
+CACHE_FAILURE_TTL = 5.0
+
+
+def _check_credentials(realm, authid, ticket):
+    """
+    Check the specified WAMP authid (user) and ticket (password), returning
+    the authorized role for the user. May block; invoked in a thread.
+    """
+    # User authenticated! Return the authorized role for this
+    # user (which is just their username).
+    return authid
+
 
 class Authenticator(ApplicationSession):
 
@@ -34,14 +64,50 @@ class Authenticator(ApplicationSession):
         Invoked after the WAMP router starts the application component and
         joins the component to its configured realm.
         """
+        # Credentials are checked in a thread pool, so that slow checks do
+        # not block the router; recent results are cached, so that sessions
+        # reconnecting at the same time do not all wait for a check.
+        pool = ThreadPool(0, THREADS, "api_auth")
+        pool.start()
+        reactor.addSystemEventTrigger("before", "shutdown", pool.stop)
+        cache = api_cache.Cache(CACHE_SIZE, CACHE_FAILURE_TTL)
+        checks = [0]
+
+        def check_credentials(realm, authid, ticket):
+            checks[0] += 1
+
+            def checked(result):
+                checks[0] -= 1
+                return result
+
+            return deferToThreadPool(
+                       reactor,
+                       pool,
+                       _check_credentials,
+                       realm,
+                       authid,
+                       ticket).addBoth(checked)
 
         def authenticate(realm, authid, ticket):
             """
             Authenticate the specified WAMP authid (user) and ticket (password).
             """
-            # User authenticated! Return the authorized role for this
-            # user (which is just their username).
-            return authid
+            if checks[0] >= THREADS + THREADS_QUEUE_SIZE:
+                return fail(
+                           ApplicationError(
+                               "com.lojack.wamp.error.busy",
+                               "Could not authenticate '{}': too many "
+                                   "authentications in progress".format(
+                                       authid)))
+            return cache.get(
+                       (realm,
+                        authid,
+                        hashlib.sha256(ticket.encode("utf-8")).hexdigest()),
+                       CACHE_TTL,
+                       check_credentials,
+                       realm,
+                       authid,
+                       ticket)
 
         # Register the above authentication procedure and the URI that
         # will be used to invoke it (must match the configured URI in
@@ -60,4 +126,3 @@ class Authenticator(ApplicationSession):
                       "Could not register procedure '{}': {}".format(
                           PROC_URI,
                           str(e)))
-
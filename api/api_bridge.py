@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+"""
+This module provides the bridge through which the web server (see the
+server_app module) serves "read" procedure results over HTTP, for clients
+(ex. monitoring tools) that do not speak WAMP.
+
+The bridge is a single, persistent application component session, started
+by the WAMP router (see .crossbar/config.json) and joined to the realm with
+a read-only role; every HTTP read is a call of the "read" procedure through
+it, instead of a WAMP connection of its own. HTTP clients authenticate with
+the credentials of a WAMP user (ex. with HTTP Basic authentication), checked
+by the authentication procedure through the bridge (see api_auth.py module),
+and are only served if the user's role is one of BRIDGE_ROLES (see
+api_rpc_config.py module).
+
+Each distinct read (data URI and parameters) has a version, which changes
+whenever its result's data (without the IPC message envelope, which differs
+from read to read) differs from the previous one's, so that HTTP clients
+can poll conditionally (ETag and If-None-Match) and receive the result only
+when it changed. Versions are drawn from a single counter, so that no version
+stands for two different results (even of a read whose version was
+forgotten), and prefixed with a token chosen when the WAMP router starts, as
+the counter starts again at 1.
+
+Exports:
+    Bridge
+        HTTP read bridge application component class.
+    authenticate
+        Authenticate a WAMP user with the specified credentials, from a web
+        server thread.
+    get_data_uri
+        Return the data URI of the specified data version and path.
+    read
+        Call the "read" procedure with the specified procedure data, from a
+        web server thread.
+"""
+
+from __future__ import unicode_literals
+
+# System modules.
+import binascii
+import itertools
+import json
+import logging
+import os
+from collections import OrderedDict
+
+# WAMP-related modules.
+from autobahn.twisted.wamp import ApplicationSession
+from autobahn.wamp.exception import ApplicationError
+from twisted.internet import reactor, threads
+from twisted.python import threadable
+from twisted.internet.defer import fail
+
+# Local modules.
+import api_auth
+import api_changes
+import api_rpc_config
+
+
+log = logging.getLogger(__name__)
+
+
+# Read Procedure URI.
+PROC_URI_READ = ".".join([api_rpc_config.PROC_URI_PREFIX, "v1", "read"])
+
+# Token prefixed to the versions of the results read since the WAMP router
+# started.
+EPOCH = binascii.hexlify(os.urandom(4)).decode("ascii")
+
+# Bridge session, once joined to the realm.
+_bridge = None
+
+# Versions of the results read: key -> [version, result data], least recently
+# read first; and the counter from which versions are drawn.
+_versions = OrderedDict()
+_version_counter = itertools.count(1)
+
+
+class Bridge(ApplicationSession):
+
+    """
+    Extend the WAMP application component class to make the session
+    available to the web server's HTTP reads while it is joined to the
+    realm.
+    """
+
+    def onJoin(self, details):
+        global _bridge
+        _bridge = self
+
+    def onLeave(self, details):
+        global _bridge
+        if _bridge is self:
+            _bridge = None
+        ApplicationSession.onLeave(self, details)
+
+
+def _get_key(data):
+    return json.dumps(data, sort_keys = True)
+
+def _get_data(result):
+    """
+    Return the data of the specified result, without the IPC message
+    envelope: that of each site's result, if read from several sites.
+    """
+    if not isinstance(result, dict):
+        return result
+    if isinstance(result.get("sites"), dict):
+        return dict(
+            (site_id, _get_data(site.get("result", site)))
+                for site_id, site in result["sites"].iteritems())
+    return dict(
+        (name, value)
+            for name, value in result.iteritems()
+                if name not in api_changes.ENVELOPE_FIELDS)
+
+def _version(result, key):
+    """
+    Return the version of the specified result of the read with the specified
+    key, and the result.
+    """
+    data = _get_data(result)
+    entry = _versions.pop(key, None)
+    if entry is None or entry[1] != data:
+        entry = [next(_version_counter), data]
+    _versions[key] = entry
+    if len(_versions) > api_rpc_config.BRIDGE_VERSIONS_SIZE:
+        _versions.popitem(last = False)
+    return "{}.{}".format(EPOCH, entry[0]), result
+
+def get_data_uri(data_version, path):
+    """
+    Return the data URI of the specified data version (ex. "v1") and path
+    (ex. "general/site_id").
+    """
+    return ".".join(
+               [api_rpc_config.DATA_URI_PREFIX, data_version] +
+               path.split("/"))
+
+def _call(proc_uri, *args):
+    if _bridge is None:
+        return fail(
+                   ApplicationError(
+                       "com.lojack.rtu.error.bridge_unavailable",
+                       "The HTTP read bridge is not joined to the realm"))
+    return _bridge.call(proc_uri, *args)
+
+def _call_from_thread(f, *args):
+    """
+    Invoke the specified function (returning a Deferred) with the specified
+    arguments in the WAMP router's event loop, blocking the calling thread (a
+    web server thread) until its result fires; errors are raised as
+    ApplicationError exceptions. Fails at once if the WAMP router's event
+    loop is not running (ex. if the web server runs without the WAMP
+    router).
+    """
+    if not reactor.running or threadable.isInIOThread():
+        raise ApplicationError(
+                  "com.lojack.rtu.error.bridge_unavailable",
+                  "The HTTP read bridge is not running")
+    return threads.blockingCallFromThread(reactor, f, *args)
+
+def _authenticate(authid, ticket):
+    def authorize(role):
+        if role not in api_rpc_config.BRIDGE_ROLES:
+            raise ApplicationError(
+                      "com.lojack.rtu.error.bridge_not_authorized",
+                      "The role of '{}' may not read via the HTTP read "
+                          "bridge".format(authid))
+        return role
+    return _call(
+               api_auth.PROC_URI,
+               _bridge.config.realm if _bridge is not None else None,
+               authid,
+               ticket).addCallback(authorize)
+
+def authenticate(authid, ticket):
+    """
+    Authenticate the specified WAMP authid (user) and ticket (password) via
+    the authentication procedure, and return the user's role, if one of
+    BRIDGE_ROLES. Blocks the calling thread, as read does.
+    """
+    return _call_from_thread(_authenticate, authid, ticket)
+
+def _read(data):
+    return _call(PROC_URI_READ, data).addCallback(_version, _get_key(data))
+
+def read(data):
+    """
+    Call the "read" procedure with the specified procedure data through the
+    bridge session, and return the result's version and the result. Blocks
+    the calling thread (a web server thread, not the WAMP router's event
+    loop) until the call completes; errors are raised as ApplicationError
+    exceptions. Fails at once if the WAMP router's event loop is not running
+    (ex. if the web server runs without the WAMP router).
+    """
+    return _call_from_thread(_read, data)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+"""
+This module provides result caching support for the WAMP/WebSocket
+interface's RPC procedures (see api_rpc.py module).
+
+Exports:
+    Cache
+        Size-bounded, least-recently-used cache of procedure results.
+"""
+
+# System modules.
+import time
+from collections import OrderedDict
+
+# WAMP-related modules.
+from autobahn.wamp.exception import ApplicationError
+from twisted.internet.defer import Deferred, fail, maybeDeferred, succeed
+from twisted.python.failure import Failure
+
+
+# Error with which invocations that did not complete by their deadline fail.
+ERROR_TIMEOUT = "com.lojack.rtu.error.timeout"
+
+
+class Cache(object):
+
+    """
+    Size-bounded, least-recently-used cache of procedure results, each of
+    which expires after its own time-to-live. Concurrent requests for a
+    result that is not cached are coalesced into a single invocation of the
+    procedure that produces it. Failures are only cached if a failure
+    time-to-live is specified.
+
+    Cancelling a request withdraws it from the invocation it awaits, which is
+    cancelled once no request awaits it. An invocation is made with the
+    arguments (and so the deadline) of the request that started it; the
+    other requests awaiting it are retried with their own arguments if it
+    times out before their deadline.
+    """
+
+    def __init__(self, size, failure_ttl = 0):
+        self.size = size
+        self.failure_ttl = failure_ttl
+        self.hits = 0
+        self.misses = 0
+        # Cached results: key -> (expiry time, result), least recently used
+        # first.
+        self._entries = OrderedDict()
+        # Results being produced: key -> [[Deferred, arguments] of each
+        # request awaiting the result, whether the result may be cached once
+        # produced, Deferred of the invocation producing it].
+        self._in_flight = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, ttl, proc, *args):
+        """
+        Return a Deferred that fires with the cached result for the specified
+        key, invoking the specified procedure with the specified arguments to
+        produce (and cache for ttl seconds) the result if it is not cached.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            if entry[0] > time.time():
+                self.hits += 1
+                self._entries[key] = entry
+                if isinstance(entry[1], Failure):
+                    return fail(entry[1])
+                return succeed(entry[1])
+        self.misses += 1
+        return self._wait(key, ttl, proc, args)
+
+    def _wait(self, key, ttl, proc, args, d = None):
+        if d is None:
+            d = Deferred(lambda d: self._cancel(key, d))
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            in_flight[0].append((d, args))
+        else:
+            in_flight = [[(d, args)], ttl > 0, None]
+            self._in_flight[key] = in_flight
+            in_flight[2] = maybeDeferred(proc, *args)
+            in_flight[2].addBoth(self._put, key, ttl, proc, in_flight)
+        return d
+
+    def _cancel(self, key, d):
+        in_flight = self._in_flight.get(key)
+        if in_flight is None:
+            return
+        in_flight[0] = [
+            waiter for waiter in in_flight[0] if waiter[0] is not d]
+        if len(in_flight[0]) == 0 and in_flight[2] is not None:
+            del self._in_flight[key]
+            in_flight[2].cancel()
+
+    def _put(self, result, key, ttl, proc, in_flight):
+        if self._in_flight.get(key) is not in_flight:
+            # Cancelled, as no request awaits the result any more.
+            return
+        del self._in_flight[key]
+        waiting, cacheable = in_flight[0], in_flight[1]
+        if isinstance(result, Failure):
+            if isinstance(result.value, ApplicationError) and \
+               result.value.error == ERROR_TIMEOUT:
+                # The invocation's deadline was that of the request that
+                # started it; retry the requests whose own deadline has not
+                # passed.
+                now = time.time()
+                expired = []
+                for d, args in waiting:
+                    details = args[-1] if args else None
+                    if getattr(details, "deadline", 0) > now:
+                        self._wait(key, ttl, proc, args, d)
+                    else:
+                        expired.append((d, args))
+                waiting = expired
+            ttl = self.failure_ttl
+            cacheable = cacheable and ttl > 0 and key not in self._in_flight
+            if cacheable:
+                result.cleanFailure()
+        if cacheable:
+            self._entries[key] = (time.time() + ttl, result)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last = False)
+        for d, args in waiting:
+            if isinstance(result, Failure):
+                d.errback(result)
+            else:
+                d.callback(result)
+
+    def invalidate(self, uri):
+        """
+        Discard the cached results for the specified data URI, for the data
+        URIs it contains and for the data URIs containing it. Results for
+        these data URIs that are being produced are not cached.
+        """
+        def matches(key):
+            return key[0] == uri or \
+                   key[0].startswith(uri + ".") or \
+                   uri.startswith(key[0] + ".")
+        for key in [key for key in self._entries if matches(key)]:
+            del self._entries[key]
+        for key, in_flight in self._in_flight.iteritems():
+            if matches(key):
+                in_flight[1] = False
+
+    def stats(self):
+        """
+        Return the cache's hit and miss counters and size.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "size": self.size}
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+"""
+This module provides the publication of changes to the data resources
+configured with "publish" (see api_rpc.py and api_rpc_config.py modules), so
+that clients can subscribe to changes instead of polling the "read"
+procedure.
+
+As the rest of the system notifies the IPC interface of changes (see
+api_ipc.py module), only what changed in each data URI's data is published,
+on the topic URI corresponding to the data URI:
+
+    "com.lojack.rtu.data.v1.general.slots" ->
+        "com.lojack.rtu.topic.v1.general.slots"
+
+Each publication (a "delta") contains:
+
+    uri
+        The data URI that changed.
+    seq
+        The publication's sequence number, consecutive per data URI. A
+        client that receives a sequence number other than the one following
+        the last it received has missed changes, and should read the data
+        URI again (ex. via the "read" procedure).
+    full
+        Whether "changed" contains all fields (the first publication for the
+        data URI, ex. after the WAMP router restarts; sequence numbers start
+        again at 1), rather than only the changed ones.
+    changed
+        The fields whose values changed, and their new values.
+    removed
+        The fields that no longer exist.
+    slots
+        For each field whose value is a list of slots (ex. "data" of the
+        "slots" sub-resource) and that was not replaced as a whole: its new
+        "length" and the "changed" slots, as a list of [index, slot] pairs.
+
+Example publication:
+    {"uri": "com.lojack.rtu.data.v1.general.slots",
+     "seq": 42,
+     "full": False,
+     "changed": {},
+     "removed": [],
+     "slots": {"data": {"length": 24, "changed": [[3, {"state": "idle"}]]}}}
+
+Exports:
+    ChangePublisher
+        Publishes the changes to data URIs as deltas.
+    get_published_resources
+        Return the data resource URIs whose changes are published.
+"""
+
+from __future__ import unicode_literals
+
+# System modules.
+import logging
+
+# Local modules.
+import api_metrics
+import api_rpc_config
+
+
+log = logging.getLogger(__name__)
+
+
+# Properties of processed IPC messages that are not data fields.
+ENVELOPE_FIELDS = frozenset([
+    "source",
+    "destination",
+    "sub",
+    "request_id",
+    "reply_to",
+    "deadline",
+    "trace_id",
+    "more"])
+
+
+def get_published_resources():
+    """
+    Return the URIs of the data resources configured with "publish".
+    """
+    return [
+        ".".join([api_rpc_config.DATA_URI_PREFIX, data_version, name])
+            for data_version, data_resources_info in \
+                api_rpc_config.DATA_PROCS.iteritems()
+                for name, data_resource_info in \
+                    data_resources_info.iteritems()
+                    if data_resource_info.get("publish")]
+
+def topic_uri(data_uri):
+    """
+    Return the topic URI on which the changes to the specified data URI are
+    published.
+    """
+    return api_rpc_config.TOPIC_URI_PREFIX + \
+           data_uri[len(api_rpc_config.DATA_URI_PREFIX):]
+
+def _diff_slots(old, new):
+    return {
+        "length": len(new),
+        "changed": [
+            [i, slot]
+                for i, slot in enumerate(new)
+                    if i >= len(old) or old[i] != slot]}
+
+
+class ChangePublisher(object):
+
+    """
+    Publishes the changes to the data URIs of the specified data resources
+    as deltas (see the module documentation), via the specified publish
+    procedure (ex. ApplicationSession.publish). The last known data of each
+    data URI is kept to compute the next delta.
+    """
+
+    def __init__(self, publish, data_resource_uris):
+        self.publish = publish
+        self.data_resource_uris = data_resource_uris
+        self._data = {}
+        self._sequences = {}
+
+    def _is_published(self, data_uri):
+        return any(
+                   data_uri == uri or data_uri.startswith(uri + ".")
+                       for uri in self.data_resource_uris)
+
+    def receive(self, data_uri, result):
+        """
+        Publish the changes in the specified data (a processed IPC
+        notification) of the specified data URI, if any.
+        """
+        if not self._is_published(data_uri) or not isinstance(result, dict):
+            return
+        data = dict(
+            (name, value)
+                for name, value in result.iteritems()
+                    if name not in ENVELOPE_FIELDS)
+        delta = self._diff(self._data.get(data_uri), data)
+        self._data[data_uri] = data
+        if delta is None:
+            return
+        seq = self._sequences.get(data_uri, 0) + 1
+        self._sequences[data_uri] = seq
+        delta["uri"] = data_uri
+        delta["seq"] = seq
+        log.debug("Publishing change %d to data URI '%s'", seq, data_uri)
+        self.publish(topic_uri(data_uri), delta)
+        api_metrics.increment("changes.published", data_uri)
+
+    def _diff(self, old, new):
+        """
+        Return the delta from the specified old data (None if unknown) to the
+        specified new data, or None if nothing changed.
+        """
+        if old is None:
+            return {
+                "full": True,
+                "changed": new,
+                "removed": [],
+                "slots": {}}
+        changed = {}
+        slots = {}
+        for name, value in new.iteritems():
+            if name not in old:
+                changed[name] = value
+            elif old[name] != value:
+                if isinstance(old[name], list) and isinstance(value, list):
+                    slots[name] = _diff_slots(old[name], value)
+                else:
+                    changed[name] = value
+        removed = [name for name in old if name not in new]
+        if len(changed) == 0 and len(slots) == 0 and len(removed) == 0:
+            return None
+        return {
+            "full": False,
+            "changed": changed,
+            "removed": removed,
+            "slots": slots}
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""
+This module provides write coalescing support for the WAMP/WebSocket
+interface's "update" procedures (see api_rpc.py module).
+
+Updates of the same data URI that arrive within a short window of each other
+are merged into a single invocation of the data procedure (and so a single
+IPC write): the fields of their "data" properties are merged, the last
+update's value of each field winning, as are their other properties. Every
+caller receives the result of the write that included its update. Updates
+that arrive while a write is in progress are merged into the next write.
+Cancelling an update withdraws its caller; a write (or a pending one) is
+cancelled once none of its callers remain.
+
+Exports:
+    Coalescer
+        Merges the updates of each data URI within a window.
+"""
+
+from __future__ import unicode_literals
+
+# System modules.
+import copy
+
+# WAMP-related modules.
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, maybeDeferred
+from twisted.python.failure import Failure
+
+# Local modules.
+import api_metrics
+
+
+class Coalescer(object):
+
+    """
+    Merges the updates of each data URI that arrive within the specified
+    window (in seconds) into a single invocation of their data procedure.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        # Updates waiting for the window to close, by data URI: [merged
+        # procedure data, call details, data procedure, [Deferreds of the
+        # callers], window timer].
+        self._pending = {}
+        # Writes in progress, by data URI: [whether the waiting updates are to
+        # be written once the write completes, Deferred of the write,
+        # [Deferreds of the callers]].
+        self._writing = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, data_proc, data, details):
+        """
+        Merge the specified update (procedure data and call details) into
+        the next invocation of the specified data procedure for its data
+        URI. Returns a Deferred that fires with the result of that
+        invocation. Updates without a "data" dictionary are not merged (the
+        data procedure rejects them).
+        """
+        if not isinstance(data.get("data"), dict):
+            return maybeDeferred(data_proc, data, details)
+        d = Deferred(lambda d: self._cancel(data["uri"], d))
+        entry = self._pending.get(data["uri"])
+        if entry is None:
+            merged = dict(data)
+            merged["data"] = dict(data["data"])
+            entry = [merged, details, data_proc, [d], None]
+            self._pending[data["uri"]] = entry
+            entry[4] = reactor.callLater(self.window, self._write, data["uri"])
+            return d
+        merged = entry[0]
+        for name, value in data.iteritems():
+            if name == "data":
+                merged["data"].update(value)
+            else:
+                merged[name] = value
+        entry[1] = self._merge_details(entry[1], details)
+        entry[3].append(d)
+        api_metrics.increment("rpc.coalesced", data["uri"])
+        return d
+
+    def _merge_details(self, details, details_next):
+        # The write is done on behalf of all callers, so it has the latest of
+        # their deadlines (see the "Timeouts" section of api_rpc.py module).
+        if details is None or details_next is None:
+            return details or details_next
+        deadline = getattr(details, "deadline", None)
+        deadline_next = getattr(details_next, "deadline", None)
+        details = copy.copy(details_next)
+        if deadline is not None and deadline_next is not None:
+            details.deadline = max(deadline, deadline_next)
+        return details
+
+    def _cancel(self, data_uri, d):
+        entry = self._pending.get(data_uri)
+        if entry is not None and d in entry[3]:
+            # The update stays merged if other callers remain.
+            entry[3].remove(d)
+            if len(entry[3]) == 0:
+                del self._pending[data_uri]
+                if entry[4].active():
+                    entry[4].cancel()
+            return
+        writing = self._writing.get(data_uri)
+        if writing is not None and d in writing[2]:
+            writing[2].remove(d)
+            if len(writing[2]) == 0 and writing[1] is not None:
+                writing[1].cancel()
+
+    def _write(self, data_uri):
+        if data_uri not in self._pending:
+            # All of the updates' callers cancelled them.
+            return
+        if data_uri in self._writing:
+            # Write the updates once the write in progress completes, so that
+            # writes of a data URI are not reordered.
+            self._writing[data_uri][0] = True
+            return
+        data, details, data_proc, waiting, timer = self._pending.pop(data_uri)
+        writing = [False, None, waiting]
+        self._writing[data_uri] = writing
+
+        def written(result):
+            del self._writing[data_uri]
+            if writing[0]:
+                self._write(data_uri)
+            for d in waiting:
+                if isinstance(result, Failure):
+                    d.errback(result)
+                else:
+                    d.callback(result)
+
+        writing[1] = maybeDeferred(data_proc, data, details)
+        writing[1].addBoth(written)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+"""
+This module provides execution support for the WAMP/WebSocket interface's
+data procedures (see api_rpc.py module). By default, data procedures are
+invoked inline, in the WAMP router's event loop (reactor); data procedures
+that block or are CPU-bound can instead be invoked in a pool of threads or
+processes, so that they do not delay the processing of other sessions.
+
+Exports:
+    ThreadPoolExecutor
+        Invokes data procedures in a bounded pool of threads.
+    ProcessPoolExecutor
+        Invokes data procedures in a bounded pool of processes.
+"""
+
+from __future__ import unicode_literals
+
+# System modules.
+import copy
+import cPickle as pickle
+import multiprocessing
+from functools import wraps
+
+# WAMP-related modules.
+from autobahn.wamp.exception import ApplicationError
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, fail
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+
+class _PoolExecutor(object):
+
+    """
+    Base class for executors invoking data procedures in a pool of a fixed
+    number of workers, with a bounded number of invocations waiting for a
+    worker. The pool is started when it is first used.
+    """
+
+    def __init__(self, name, size, queue_size):
+        self.name = name
+        self.size = size
+        self.queue_size = queue_size
+        self.in_progress = 0
+        self._pool = None
+
+    def _start(self):
+        raise NotImplementedError
+
+    def _invoke(self, proc, data, details):
+        raise NotImplementedError
+
+    def _invoked(self, result):
+        self.in_progress -= 1
+        return result
+
+    def start(self):
+        """
+        Start the pool now, rather than when it is first used.
+        """
+        if self._pool is None:
+            self._pool = self._start()
+
+    def wrap(self, proc):
+        """
+        Return a data procedure that invokes the specified data procedure in
+        the pool, returning a Deferred that fires with its result.
+        """
+        @wraps(proc)
+        def _proc_pooled(data, details = None):
+            if self.in_progress >= self.size + self.queue_size:
+                return fail(
+                           ApplicationError(
+                               "com.lojack.rtu.error.rpc_exec_busy",
+                               "Could not invoke '{}.{}': {} pool is "
+                                   "busy".format(
+                                       proc.__module__,
+                                       proc.__name__,
+                                       self.name)))
+            self.start()
+            self.in_progress += 1
+            return self._invoke(proc, data, details).addBoth(self._invoked)
+        return _proc_pooled
+
+
+class ThreadPoolExecutor(_PoolExecutor):
+
+    """
+    Invokes data procedures in a bounded pool of threads. Data procedures
+    invoked this way may block, but must return their result (rather than a
+    Deferred) and must not use the reactor or other Twisted APIs (ex. those
+    of the api_ipc module), which are not thread-safe. In-progress results
+    they report are forwarded from the reactor thread.
+    """
+
+    def _start(self):
+        pool = ThreadPool(0, self.size, "api_exec." + self.name)
+        pool.start()
+        reactor.addSystemEventTrigger("before", "shutdown", pool.stop)
+        return pool
+
+    def _invoke(self, proc, data, details):
+        if details is not None and details.progress:
+            progress = details.progress
+            details = copy.copy(details)
+            details.progress = \
+                lambda *args, **kwargs: \
+                    reactor.callFromThread(progress, *args, **kwargs)
+        return deferToThreadPool(
+                   reactor,
+                   self._pool,
+                   proc,
+                   data,
+                   details)
+
+
+def _invoke_in_process(proc, data):
+    """
+    Internal procedure invoked in a pool process to invoke the specified data
+    procedure, returning its result (pickled, so that a result that cannot be
+    pickled is reported as an error rather than lost) or the details of the
+    error it raised (exceptions cannot be returned from pool processes
+    reliably).
+    """
+    try:
+        return True, pickle.dumps(
+                         proc(data, None),
+                         pickle.HIGHEST_PROTOCOL)
+    except ApplicationError as e:
+        return False, (e.error, e.args[0] if e.args else "")
+    except Exception as e:
+        return False, ("com.lojack.rtu.error.rpc_failed", str(e))
+
+
+class ProcessPoolExecutor(_PoolExecutor):
+
+    """
+    Invokes data procedures in a bounded pool of processes, for CPU-bound
+    work. Data procedures invoked this way must be module-level functions
+    whose data and result can be pickled, must return their result (rather
+    than a Deferred) and cannot report in-progress results (they are invoked
+    without call details). Invocations whose result is not received within
+    the specified timeout (in seconds), for example because their data could
+    not be pickled or their process died, fail and release their place in
+    the pool.
+    """
+
+    def __init__(self, name, size, queue_size, timeout):
+        _PoolExecutor.__init__(self, name, size, queue_size)
+        self.timeout = timeout
+
+    def _start(self):
+        pool = multiprocessing.Pool(self.size)
+        reactor.addSystemEventTrigger("before", "shutdown", pool.terminate)
+        return pool
+
+    def _invoke(self, proc, data, details):
+        d = Deferred()
+
+        def invoked(result):
+            if d.called:
+                return
+            timer.cancel()
+            success, value = result
+            if success:
+                d.callback(pickle.loads(value))
+            else:
+                d.errback(ApplicationError(*value))
+
+        def lost():
+            d.errback(
+                ApplicationError(
+                    "com.lojack.rtu.error.rpc_exec_lost",
+                    "No result received from '{}.{}' within {} seconds in "
+                        "{} pool".format(
+                            proc.__module__,
+                            proc.__name__,
+                            self.timeout,
+                            self.name)))
+
+        timer = reactor.callLater(self.timeout, lost)
+        self._pool.apply_async(
+            _invoke_in_process,
+            (proc, data),
+            callback = lambda result: reactor.callFromThread(invoked, result))
+        return d
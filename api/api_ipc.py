@@ -9,20 +9,48 @@ information.
 Exports:
     Server
         WAMP/WebSocket interface internal IPC component class.
+    start
+        Open the shared IPC client connection.
+    request
+        Send a request via the shared IPC client connection.
+    request_many
+        Send several requests via the shared IPC client connection.
+    listen
+        Add a listener for the change notifications received via the shared
+        IPC client connection.
+    request_sites
+        Send a request to several sites' IPC interfaces concurrently.
 """
 
+from __future__ import unicode_literals
+
 # System modules.
-import copy
-import uuid
+import logging
+import random
+import time
+from collections import deque
 
 # WAMP-related modules.
-from autobahn.twisted.util import sleep
-from autobahn.twisted.wamp import ApplicationSession, ApplicationRunner
+from autobahn.twisted.wamp import ApplicationSession
+from autobahn.twisted.rawsocket import WampRawSocketClientFactory
+from autobahn.twisted.websocket import WampWebSocketClientFactory
+from autobahn.wamp import serializer
 from autobahn.wamp.exception import ApplicationError
-from twisted.internet.defer import inlineCallbacks
+from autobahn.wamp.types import ComponentConfig, PublishOptions
+from twisted.internet import reactor
+from twisted.internet.defer import \
+    Deferred, DeferredList, fail, inlineCallbacks, succeed
+from twisted.internet.endpoints import clientFromString
+from twisted.python.failure import Failure
 
 # Local modules.
+import api_ipc_config
+import api_metrics
 import api_rpc_config
+import api_trace
+
+
+log = logging.getLogger(__name__)
 
 
 # IPC "Send Message" Procedure URI.
@@ -31,8 +59,153 @@ PROC_URI_SEND = "com.lojack.ipc.proc.v1.send"
 # IPC "Receive Message" Topic URI.
 TOPIC_URI_RECEIVE = "com.lojack.ipc.topic.v1.receive"
 
+# WAMP serializer classes, by name (see api_ipc_config.SERIALIZERS); the
+# MessagePack serializer is only available if the msgpack package is
+# installed.
+SERIALIZER_CLASSES = {
+    "json": serializer.JsonSerializer,
+    "msgpack": getattr(serializer, "MsgPackSerializer", None)}
+
+# IPC components that send unsolicited messages (without a request ID) to
+# notify of changes to their data, and the data resource URI of that data;
+# the message's "sub" property (if any) names the sub-resource that changed.
+NOTIFICATION_RESOURCES = {
+    "system_monitor":
+        ".".join([api_rpc_config.DATA_URI_PREFIX, "v1", "general"])}
+
+
+class Mailbox(object):
+
+    """
+    Bounded, first-in first-out queue of messages received from the IPC
+    interface. A consumer waiting on the mailbox is woken once the batch of
+    messages it waits for is complete: at the end of the reactor turn in
+    which the first message is put into it (so that the messages put in the
+    same turn are taken together), or, if it waits for a longer interval,
+    once the interval has elapsed or enough messages are waiting.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._messages = deque()
+        self._bytes = 0
+        self._waiting = None
+        self._batch = (0, None, None)
+        self._timer = None
+
+    def __len__(self):
+        return len(self._messages)
+
+    def _get_all(self, result = None):
+        messages = list(self._messages)
+        self._messages.clear()
+        self._bytes = 0
+        return messages
+
+    def _is_complete(self):
+        interval, count, size = self._batch
+        return (count is not None and len(self._messages) >= count) or \
+               (size is not None and self._bytes >= size)
+
+    def _wake(self):
+        if self._timer is not None and self._timer.active():
+            self._timer.cancel()
+        self._timer = None
+        d, self._waiting = self._waiting, None
+        d.callback(None)
+
+    def put(self, message, size = 0):
+        """
+        Put the specified message (of the specified approximate size, in
+        bytes) into the mailbox, waking the waiting consumer (if any).
+        """
+        if len(self._messages) >= self.size:
+            raise ApplicationError(
+                      "com.lojack.ipc.error.mailbox.full",
+                      "Could not write to IPC interface: mailbox is full "
+                          "({} messages)".format(self.size))
+        self._messages.append(message)
+        self._bytes += size
+        if self._waiting is not None:
+            if self._is_complete():
+                self._wake()
+            elif self._timer is None:
+                self._timer = reactor.callLater(self._batch[0], self._wake)
+
+    def get_all(self, interval = 0, count = None, size = None):
+        """
+        Return a Deferred that fires with a list of all messages in the
+        mailbox (removing them), at the end of the reactor turn in which
+        there is at least one. If an interval (in seconds) is specified, it
+        fires once the interval has elapsed since the first message was put
+        into the mailbox instead. Either way, it fires as soon as there are
+        at least the specified number of messages or bytes of messages, if
+        earlier.
+        """
+        self._batch = (interval, count, size)
+        if len(self._messages) > 0 and self._is_complete():
+            return succeed(self._get_all())
+        self._waiting = Deferred()
+        self._waiting.addCallback(self._get_all)
+        if len(self._messages) > 0:
+            self._timer = reactor.callLater(interval, self._wake)
+        return self._waiting
+
+
+def _get_trace_id(message_info):
+    """
+    Return the trace ID carried by the specified IPC message (see api_trace.py
+    module), or None if it is not traced.
+    """
+    try:
+        return message_info["message"].get("trace_id")
+    except (AttributeError, KeyError, TypeError):
+        return None
+
+
+def _get_deadline(message_info):
+    """
+    Return the deadline (a time.time() value) of the specified IPC message,
+    or None if it has none.
+    """
+    try:
+        deadline = message_info["message"].get("deadline")
+    except (AttributeError, KeyError, TypeError):
+        return None
+    if not isinstance(deadline, (int, long, float)):
+        return None
+    return deadline
+
+
+def _get_size(value):
+    """
+    Return the approximate size (in bytes) of the specified message when
+    serialized, without serializing it.
+    """
+    if isinstance(value, basestring):
+        return len(value) + 2
+    if isinstance(value, dict):
+        return 2 + sum(
+                       _get_size(key) + _get_size(item)
+                           for key, item in value.iteritems())
+    if isinstance(value, (list, tuple)):
+        return 2 + sum(_get_size(item) for item in value)
+    return 8
+
+
+def _get_reply_to(message_info):
+    """
+    Return the ID of the client session to which a response to the specified
+    IPC message is to be sent, or None if it is not known.
+    """
+    try:
+        reply_to = message_info["message"].get("reply_to")
+    except (AttributeError, KeyError, TypeError):
+        return None
+    if not isinstance(reply_to, (int, long)):
+        return None
+    return reply_to
 
-_dummy = []
 
 class Server(ApplicationSession):
 
@@ -47,17 +220,23 @@ class Server(ApplicationSession):
         Invoked after the WAMP router starts the application component and
         joins the component to its configured realm.
         """
-        global _dummy
+        mailbox = Mailbox(api_ipc_config.MAILBOX_SIZE)
+        api_metrics.register_gauge("ipc.mailbox", mailbox.__len__)
+        batch = api_ipc_config.BATCH
 
         def send_message(message_info):
             """
             Sends the specified messages to the specified destination.
             """
             # Dummy code to mimic sending to the rest of the system; just
-            # append the specified request in the _dummy variable to be picked
-            # up by the publish code below.
-            global _dummy
-            _dummy.append(message_info)
+            # put the specified request in the mailbox to be picked up by the
+            # publish code below (with the time it was queued, for tracing,
+            # and its size, for batching by size).
+            size = \
+                _get_size(message_info) \
+                    if batch is not None and batch["bytes"] is not None \
+                    else 0
+            mailbox.put((time.time(), message_info, size), size)
 
         try:
             # Register the procedure to send requests to other IPC components.
@@ -76,37 +255,231 @@ class Server(ApplicationSession):
                           str(e)))
         # Process incoming messages from the IPC interface, forever.
         while True:
-			# Allow other processing (i.e., sending of messages) to occur.
-            yield sleep(1)
-            # Get a dummy counter message every second.
-            if len(_dummy) > 0:
-                try:
-                    message = _dummy.pop(0)
-                except Exception as e:
-                    raise ApplicationError(
-                              "com.lojack.ipc.error.mailbox.receive",
-                              "Could not read from IPC interface: "
-                                  "{}".format(str(e)))
-                else:
-                    # Publish the received message.
-                    yield self.publish(
-                              TOPIC_URI_RECEIVE,
-                              message)
+            # Wait for messages, allowing other processing (i.e., sending of
+            # messages) to occur in the meantime.
+            if batch is not None:
+                messages = \
+                    yield mailbox.get_all(
+                              batch["interval"],
+                              batch["count"],
+                              batch["bytes"])
+            else:
+                messages = yield mailbox.get_all()
+            # Publish all received messages, in batches.
+            for reply_to, batch_messages in self._get_batches(messages):
+                self._publish_batch(reply_to, batch_messages)
+
+    def _get_batches(self, messages):
+        """
+        Return the specified received messages (except those whose deadline
+        has passed; their requester no longer awaits a response) as a list
+        of (reply_to, messages) batches to be published, each within the
+        configured batch limits. The messages of a batch all have the same
+        recipient session ID (reply_to; None for all sessions).
+        """
+        now = time.time()
+        batch = api_ipc_config.BATCH
+        batches = []
+        open_batches = {}
+        for queued, message, size in messages:
+            deadline = _get_deadline(message)
+            if deadline is not None and deadline < now:
+                api_metrics.increment("ipc.dropped", "expired")
+                continue
+            reply_to = _get_reply_to(message)
+            entry = open_batches.get(reply_to)
+            if entry is None or \
+               batch is None or \
+               (batch["count"] is not None and
+                len(entry[1]) >= batch["count"]) or \
+               (batch["bytes"] is not None and
+                entry[2] + size > batch["bytes"]):
+                entry = [reply_to, [], 0]
+                open_batches[reply_to] = entry
+                batches.append(entry)
+            entry[1].append((queued, message))
+            entry[2] += size
+        return [(reply_to, batch_messages)
+                    for reply_to, batch_messages, size in batches]
+
+    def _publish_batch(self, reply_to, messages):
+        """
+        Publish the specified messages as a single event, to the specified
+        client session (if any) or to all.
+        """
+        start = time.time()
+        # Publish a response only to the client session that sent the
+        # request (there can be one per worker process; see api_worker.py
+        # module).
+        if reply_to is not None:
+            self.publish(
+                TOPIC_URI_RECEIVE,
+                *[message for queued, message in messages],
+                options = PublishOptions(eligible = [reply_to]))
+        else:
+            self.publish(
+                TOPIC_URI_RECEIVE,
+                *[message for queued, message in messages])
+        for queued, message in messages:
+            trace_id = _get_trace_id(message)
+            if trace_id is not None:
+                api_trace.record(
+                    trace_id,
+                    "ipc.mailbox",
+                    queued,
+                    start,
+                    destination = message.get("destination"))
+                api_trace.record(
+                    trace_id,
+                    "ipc.publish",
+                    start,
+                    time.time(),
+                    destination = message.get("destination"),
+                    batch = len(messages))
+
+
+class PendingRequests(object):
+
+    """
+    Bounded table of requests sent via the IPC interface that are awaiting a
+    response. Each request occupies one of a fixed number of slots; its
+    request ID encodes both the slot (for constant-time lookup) and the number
+    of times the slot has been used (so that a late response to an earlier
+    request is never mistaken for a response to the current one). Request
+    IDs are offset by a random base chosen per table, so that the tables of
+    different processes do not issue the same IDs (and a response is not
+    mistaken for one to another process' request). Requests that are not
+    answered before they expire fail.
+    """
+
+    def __init__(self, size, expiry):
+        self.size = size
+        self.expiry = expiry
+        # Request IDs stay below 2 ** 53, so that they remain exact as JSON
+        # numbers.
+        self._base = random.SystemRandom().randrange(1, 2 ** 22) * 2 ** 31
+        self._slots = [None] * size
+        self._generations = [0] * size
+        self._generation_max = 2 ** 31 // size
+        self._free = deque(xrange(size))
+
+    def __len__(self):
+        return self.size - len(self._free)
+
+    def add(self, info, deadline = None):
+        """
+        Add a request with the specified information to the table. Returns
+        the request ID and a Deferred to be fired with the request's result.
+        The request expires at the specified deadline (a time.time() value),
+        if it is earlier than the table's expiry time, failing with a
+        "com.lojack.rtu.error.timeout" error (see the "Timeouts" section of
+        api_rpc.py module). Cancelling the Deferred removes the request.
+        """
+        if len(self._free) == 0:
+            raise ApplicationError(
+                      "com.lojack.ipc.error.busy",
+                      "Too many IPC requests awaiting a response "
+                          "({})".format(self.size))
+        slot = self._free.popleft()
+        generation = (self._generations[slot] + 1) % self._generation_max
+        self._generations[slot] = generation
+        request_id = self._base + generation * self.size + slot
+        d = Deferred(lambda d: self.pop(request_id))
+        timer = \
+            reactor.callLater(
+                self._get_expiry(deadline),
+                self._expire,
+                request_id)
+        self._slots[slot] = (request_id, d, info, timer, deadline)
+        return request_id, d
+
+    def _get_expiry(self, deadline):
+        if deadline is None:
+            return self.expiry
+        return max(0, min(self.expiry, deadline - time.time()))
+
+    def _get(self, request_id):
+        if not isinstance(request_id, (int, long)) or \
+           not self._base <= request_id < self._base + 2 ** 31:
+            return None
+        entry = self._slots[(request_id - self._base) % self.size]
+        if entry is None or entry[0] != request_id:
+            return None
+        return entry
+
+    def renew(self, request_id):
+        """
+        Restart the expiry time of the specified request, which remains in
+        the table. Returns the request's Deferred and information, or None if
+        the request is not pending.
+        """
+        entry = self._get(request_id)
+        if entry is None:
+            return None
+        entry[3].reset(self._get_expiry(entry[4]))
+        return entry[1], entry[2]
+
+    def pop(self, request_id):
+        """
+        Remove the specified request from the table. Returns the request's
+        Deferred and information, or None if the request is not pending.
+        """
+        entry = self._get(request_id)
+        if entry is None:
+            return None
+        slot = (request_id - self._base) % self.size
+        self._slots[slot] = None
+        self._free.append(slot)
+        if entry[3].active():
+            entry[3].cancel()
+        return entry[1], entry[2]
 
+    def _expire(self, request_id):
+        entry = self._get(request_id)
+        if entry is None:
+            return
+        self.pop(request_id)
+        deadline = entry[4]
+        if deadline is not None and time.time() >= deadline:
+            entry[1].errback(
+                ApplicationError(
+                    "com.lojack.rtu.error.timeout",
+                    "No IPC response received by the deadline"))
+        else:
+            entry[1].errback(
+                ApplicationError(
+                    "com.lojack.ipc.error.expired",
+                    "No IPC response received in time"))
+
+    def fail_all(self, error):
+        """
+        Remove all requests from the table, failing each with the specified
+        error.
+        """
+        for entry in list(self._slots):
+            if entry is not None and self.pop(entry[0]) is not None:
+                entry[1].errback(error)
 
-_results = {}
-_results_procs = {}
 
 class Client(ApplicationSession):
 
-    next_request_id = 0
+    """
+    Extend the WAMP application component class to send requests to the rest
+    of the system via the internal IPC mechanism and to route the responses
+    back to the requesters. A single, long-lived instance is shared by all
+    requesters in the process (see the Connection class); its single
+    subscription to received IPC messages dispatches each response to its
+    requester by request ID. Requests carry the session's ID ("reply_to"),
+    so that responses reach only the session (and process) that sent them.
+    """
 
-    def _get_next_request_id(self):
-        result = Client.next_request_id
-        Client.next_request_id += 1
-        if Client.next_request_id == 1000000000:
-            Client.next_request_id = 0
-        return result
+    def __init__(self, config):
+        ApplicationSession.__init__(self, config)
+        # Requests awaiting a response (shared by all of the connection's
+        # sessions).
+        self._pending = config.extra["connection"].pending
+        self._site_id = config.extra["connection"].site_id
+        self._listeners = config.extra["connection"].listeners
 
     def _get_resource(self, uri):
         uri_resource_fields = \
@@ -125,8 +498,18 @@ class Client(ApplicationSession):
             message_info["message"]["sub"] = resource_sub[0]
         return message_info
 
+    def _create_ipc_message_config(self, request, resource_sub):
+        message_info = {
+            "destination": "config_manager",
+            "message": {
+                "action": request.get("action", "read")}}
+        if len(resource_sub) > 0:
+            message_info["message"]["sub"] = resource_sub[0]
+        if "data" in request:
+            message_info["message"]["data"] = request["data"]
+        return message_info
+
     def _create_ipc_message(self, request):
-        global _results_procs
         resource = self._get_resource(request["uri"])
         func = "_".join(["", "create", "ipc", "message", resource["main"]])
         message_info = \
@@ -135,60 +518,584 @@ class Client(ApplicationSession):
                 func)(
                     request,
                     resource["sub"])
-        self.request_id = self._get_next_request_id()
         message_info["message"]["source"] = "www_api"
-        message_info["message"]["request_id"] = self.request_id
-        _results_procs[self.request_id] = resource["main"]
-        return message_info
+        return resource["main"], message_info
 
     def _process_ipc_event_general(self, event):
         result = event
-        result["site_id"] = "XX"
+        result["site_id"] = self._site_id
         return result
 
+    def _process_ipc_event_config(self, event):
+        return event
+
+    def _process_ipc_message(self, resource_main, message, source):
+        """
+        Process the specified message received from the specified source in
+        response to a request for the specified resource. Returns the result,
+        or a Failure if the message could not be processed.
+        """
+        message["source"], message["destination"] = \
+            source, message.get("source")
+        func = "_".join(["", "process", "ipc", "event", resource_main])
+        try:
+            return getattr(
+                       self,
+                       func)(message)
+        except Exception as e:
+            return Failure(
+                       ApplicationError(
+                           "com.lojack.ipc.error.receive",
+                           "Could not process IPC message: {}".format(
+                               str(e))))
+
+    def _process_ipc_events(self, *events):
+        """
+        Invoked for each event received from the IPC interface; an event
+        carries a batch of one or more messages (see api_ipc_config.BATCH),
+        which are processed in order.
+        """
+        for event in events:
+            self._process_ipc_event(event)
+
     def _process_ipc_event(self, event):
-        global _results
-        if hasattr(event, "request_id") and \
-           event["request_id"] == self.request_id:
-            tmp = event["source"]
-            event["source"] = event["destination"]
-            event["destination"] = tmp
-            func = "_".join(["", "process", "ipc", "event", _results_procs[self.request_id]])
-            _results[self.config.extra["result_id"]] = \
-                getattr(
-                    self,
-                    func)(event)
-            self.leave()
+        """
+        Invoked for each message received from the IPC interface; completes
+        the request the message responds to, if any.
+
+        A response can be split into several messages ("chunks"), each but
+        the last marked with a true "more" property and each containing part
+        of the response's "data" list. If the requester asked for in-progress
+        results, each chunk is passed on as soon as it is received and the
+        last one is the final result. Otherwise, the chunks' data is
+        assembled into the final result.
+        """
+        try:
+            message = event["message"]
+        except (KeyError, TypeError):
+            return
+        if not isinstance(message, dict):
+            return
+        if "request_id" not in message:
+            self._process_ipc_notification(event, message)
+            return
+        request_id = message["request_id"]
+        # Ignore responses addressed to other client sessions; those that are
+        # not addressed are matched by request ID alone, which is unique to
+        # the process (see the PendingRequests class).
+        if message.get("reply_to", self._session_id) != self._session_id:
+            return
+        if message.get("more"):
+            entry = self._pending.renew(request_id)
+        else:
+            entry = self._pending.pop(request_id)
+        if entry is None:
+            return
+        trace_id = message.get("trace_id")
+        start = time.time()
+        self._process_ipc_response(event, message, request_id, entry)
+        if trace_id is not None:
+            api_trace.record(
+                trace_id,
+                "ipc.process",
+                start,
+                time.time(),
+                source = event.get("destination"),
+                more = bool(message.get("more")))
+
+    def _process_ipc_notification(self, event, message):
+        """
+        Process the specified unsolicited message, notifying of a change to
+        the data of the IPC component that sent it, and pass the result to
+        each listener with the data URI that changed.
+        """
+        source = event.get("destination")
+        data_uri = NOTIFICATION_RESOURCES.get(source)
+        if data_uri is None or len(self._listeners) == 0:
+            return
+        if isinstance(message.get("sub"), basestring):
+            data_uri = ".".join([data_uri, message["sub"]])
+        result = \
+            self._process_ipc_message(
+                self._get_resource(data_uri)["main"],
+                message,
+                source)
+        if isinstance(result, Failure):
+            log.warning(
+                "Could not process IPC notification for data URI '%s': %s",
+                data_uri,
+                result.getErrorMessage())
+            return
+        for listener in list(self._listeners):
+            try:
+                listener(data_uri, result)
+            except Exception:
+                log.exception(
+                    "IPC notification listener %r failed for data URI '%s'",
+                    listener,
+                    data_uri)
+
+    def _process_ipc_response(self, event, message, request_id, entry):
+        """
+        Process the specified message, received in response to the specified
+        pending request (see _process_ipc_event).
+        """
+        d, info = entry
+        if not isinstance(info, list):
+            resource_main, progress, chunks = info
+            result = \
+                self._process_ipc_message(
+                    resource_main,
+                    message,
+                    event["destination"])
+            if isinstance(result, Failure):
+                if message.get("more"):
+                    self._pending.pop(request_id)
+                d.errback(result)
+            elif message.get("more"):
+                if progress is not None:
+                    progress(result)
+                else:
+                    chunks.extend(result.get("data", []))
+            else:
+                if len(chunks) > 0:
+                    chunks.extend(result.get("data", []))
+                    result["data"] = chunks
+                d.callback(result)
+        elif not isinstance(message.get("batch"), list) or \
+             len(message["batch"]) != len(info):
+            d.errback(
+                ApplicationError(
+                    "com.lojack.ipc.error.receive",
+                    "Could not process IPC message: expected a batch of "
+                        "{} messages".format(len(info))))
+        else:
+            # Batch response; process the message for each batched request.
+            d.callback([
+                self._process_ipc_message(
+                    resource_main,
+                    item_message,
+                    event["destination"])
+                for resource_main, item_message in zip(
+                    info,
+                    message["batch"])])
+
+    def _create_ipc_message_failed(self, request, e):
+        return fail(
+                   ApplicationError(
+                       "com.lojack.ipc.error.send",
+                       "Could not create IPC message for data URI "
+                           "'{}': {}".format(
+                               request.get("uri"),
+                               str(e))))
+
+    def _observe(self, result, destination, start):
+        api_metrics.observe("ipc.request", destination, time.time() - start)
+        return result
+
+    def _trace(self, result, trace_id, span, destination, start):
+        api_trace.record(
+            trace_id,
+            span,
+            start,
+            time.time(),
+            destination = destination,
+            error = isinstance(result, Failure))
+        return result
+
+    def _send_ipc_message(self, message_info, info, deadline):
+        """
+        Send the specified message via the IPC interface, awaiting a response
+        for the request(s) described by the specified information until the
+        specified deadline (if any). Returns a Deferred that fires with the
+        processed response.
+        """
+        try:
+            request_id, d = self._pending.add(info, deadline)
+        except ApplicationError as e:
+            return fail(e)
+        message_info["message"]["request_id"] = request_id
+        message_info["message"]["reply_to"] = self._session_id
+        # Carry the deadline (if any) in the message, so that the rest of the
+        # system can drop the request once it has expired.
+        if deadline is not None:
+            message_info["message"]["deadline"] = deadline
+        start = time.time()
+        d.addBoth(
+            self._observe,
+            message_info["destination"],
+            start)
+        # Carry the current trace (if any) in the message, next to the
+        # request ID, so that each part of its processing can be traced.
+        trace_id = api_trace.current
+        if trace_id is not None:
+            message_info["message"]["trace_id"] = trace_id
+            d.addBoth(
+                self._trace,
+                trace_id,
+                "ipc.request",
+                message_info["destination"],
+                start)
+
+        def send_failed(failure):
+            if self._pending.pop(request_id) is not None:
+                d.errback(failure)
+
+        sent = \
+            self.call(
+                PROC_URI_SEND,
+                message_info)
+        if trace_id is not None:
+            sent.addBoth(
+                self._trace,
+                trace_id,
+                "ipc.send",
+                message_info["destination"],
+                start)
+        sent.addErrback(send_failed)
+        return d
+
+    def request(self, request, progress = None, deadline = None):
+        """
+        Send the specified request via the IPC interface and return a
+        Deferred that fires with the processed response. If an in-progress
+        result procedure is specified, it is invoked with each chunk of a
+        response split into several messages. If a deadline (a time.time()
+        value) is specified, the request fails once it passes.
+        """
+        try:
+            resource_main, message_info = \
+                self._create_ipc_message(request)
+        except Exception as e:
+            return self._create_ipc_message_failed(request, e)
+        return self._send_ipc_message(
+                   message_info,
+                   (resource_main, progress, []),
+                   deadline)
+
+    def request_many(self, requests, deadline = None):
+        """
+        Send the specified requests via the IPC interface and return a list
+        of Deferreds, one for each request, that fire with the processed
+        responses. Requests for the same IPC destination are sent together,
+        in a single "batch" message, whose response must contain a batch of
+        messages responding to each request, in order.
+        """
+        results = [None] * len(requests)
+        # Requests by IPC destination: destination ->
+        # [(request index, resource, message information)].
+        batches = {}
+        for i, request in enumerate(requests):
+            try:
+                resource_main, message_info = \
+                    self._create_ipc_message(request)
+            except Exception as e:
+                results[i] = self._create_ipc_message_failed(request, e)
+            else:
+                batches.setdefault(
+                    message_info["destination"],
+                    []).append((i, resource_main, message_info))
+        for destination, batch in batches.iteritems():
+            if len(batch) == 1:
+                i, resource_main, message_info = batch[0]
+                results[i] = \
+                    self._send_ipc_message(
+                        message_info,
+                        (resource_main, None, []),
+                        deadline)
+                continue
+            message_info = {
+                "destination": destination,
+                "message": {
+                    "source": "www_api",
+                    "batch": [
+                        item_message_info["message"]
+                            for i, resource_main, item_message_info
+                                in batch]}}
+            item_ds = [Deferred() for item in batch]
+
+            def completed(item_results, item_ds = item_ds):
+                for item_d, item_result in zip(item_ds, item_results):
+                    if isinstance(item_result, Failure):
+                        item_d.errback(item_result)
+                    else:
+                        item_d.callback(item_result)
+
+            def failed(failure, item_ds = item_ds):
+                for item_d in item_ds:
+                    item_d.errback(failure)
+
+            self._send_ipc_message(
+                message_info,
+                [resource_main
+                    for i, resource_main, item_message_info in batch],
+                deadline).addCallbacks(completed, failed)
+            for (i, resource_main, item_message_info), item_d in zip(
+                    batch,
+                    item_ds):
+                results[i] = item_d
+        return results
 
     @inlineCallbacks
     def onJoin(self, details):
-        print "in Client.onJoin, subscribing to:", TOPIC_URI_RECEIVE
+        """
+        Invoked after the session joins the IPC realm; subscribes to messages
+        received from the IPC interface and makes the session available to
+        requesters.
+        """
         yield self.subscribe(
-                  self._process_ipc_event,
+                  self._process_ipc_events,
                   TOPIC_URI_RECEIVE)
-        print "in Client.onJoin, invoking:", PROC_URI_SEND
-        yield self.call(
-                  PROC_URI_SEND,
-                  self._create_ipc_message(self.config.extra["request"]))
-
-
-class Request(object):
-
-    def process(self, request):
-        global _results
-        result_id = uuid.uuid4().hex
-        print "api_ipc.Request.process: Creating ApplicationRunner"
-        runner = ApplicationRunner(
-                     "wss://127.0.0.1/api",
-                     "ipc",
-                     extra = {
-                         "request": request,
-                         "result_id": result_id})
-        print "api_ipc.Request.process: Running ApplicationRunner"
-        runner.run(Client)
-        print "api_ipc.Request.process: back from ApplicationRunner; "
-        print " results:", _results[result_id]
-        result = copy.deepcopy(_results[result_id])
-        del _results[result_id]
-        return result
+        self.config.extra["connection"]._attach(self)
+
+    def onLeave(self, details):
+        self.disconnect()
+
+    def onDisconnect(self):
+        # Fail all requests still awaiting a response; they can no longer be
+        # received.
+        self._pending.fail_all(
+            ApplicationError(
+                "com.lojack.ipc.error.disconnected",
+                "IPC client connection lost"))
+        self.config.extra["connection"]._detach(self)
+
+
+class Connection(object):
+
+    """
+    Maintain a persistent client session to the IPC realm of a site,
+    reconnecting automatically, through which all IPC requests to the site
+    are sent.
+    """
+
+    def __init__(self, realm, endpoint, url = None, site_id = None):
+        """
+        The connection is made to the specified Twisted client endpoint
+        description; via a WebSocket transport if a WebSocket URL is
+        specified, otherwise via a RawSocket transport. The site ID defaults
+        to this WAMP router's (api_ipc_config.SITE_ID).
+        """
+        self.realm = realm
+        self.endpoint = endpoint
+        self.url = url
+        # Site IDs are text, so that the MessagePack serializer does not
+        # serialize them as bytes.
+        self.site_id = unicode(site_id or api_ipc_config.SITE_ID)
+        self.session = None
+        self.pending = \
+            PendingRequests(
+                api_ipc_config.PENDING_SIZE,
+                api_ipc_config.PENDING_EXPIRY)
+        # Listeners for change notifications (shared by all of the
+        # connection's sessions).
+        self.listeners = []
+        self._started = False
+        self._reconnect_delay = api_ipc_config.RECONNECT_DELAY
+
+    def start(self):
+        """
+        Open the connection (once); it is reopened whenever it is lost.
+        """
+        if not self._started:
+            self._started = True
+            self._connect()
+
+    def _connect(self):
+        def create():
+            return Client(ComponentConfig(self.realm, {"connection": self}))
+        if self.url is not None:
+            factory = \
+                WampWebSocketClientFactory(
+                    create,
+                    url = self.url,
+                    serializers = _get_serializers())
+        else:
+            factory = \
+                WampRawSocketClientFactory(
+                    create,
+                    _get_serializers()[0])
+        d = clientFromString(
+                reactor,
+                self.endpoint).connect(factory)
+        d.addErrback(self._connect_failed)
+
+    def _connect_failed(self, failure):
+        # The router starts its transports after its components, so the
+        # first attempt can fail; only warn about later ones.
+        log.log(
+            logging.INFO
+                if self._reconnect_delay == api_ipc_config.RECONNECT_DELAY
+                else logging.WARNING,
+            "Could not connect to IPC realm '%s' at '%s': %s",
+            self.realm,
+            self.url or self.endpoint,
+            failure.getErrorMessage())
+        self._reconnect()
+
+    def _reconnect(self):
+        delay = self._reconnect_delay
+        self._reconnect_delay = \
+            min(delay * 2, api_ipc_config.RECONNECT_DELAY_MAX)
+        reactor.callLater(delay, self._connect)
+
+    def _attach(self, session):
+        log.info(
+            "Joined IPC realm '%s' at '%s'",
+            self.realm,
+            self.url or self.endpoint)
+        self.session = session
+        self._reconnect_delay = api_ipc_config.RECONNECT_DELAY
+
+    def _detach(self, session):
+        if self.session is session:
+            self.session = None
+        self._reconnect()
+
+    def request(self, request, progress = None, deadline = None):
+        """
+        Send the specified request via the IPC interface and return a
+        Deferred that fires with the processed response (see
+        Client.request).
+        """
+        if self.session is None:
+            return fail(
+                       ApplicationError(
+                           "com.lojack.ipc.error.not_connected",
+                           "Not connected to IPC realm '{}'".format(
+                               self.realm)))
+        return self.session.request(request, progress, deadline)
+
+    def request_many(self, requests, deadline = None):
+        """
+        Send the specified requests via the IPC interface and return a list
+        of Deferreds, one for each request, that fire with the processed
+        responses.
+        """
+        if self.session is None:
+            return [self.request(request) for request in requests]
+        return self.session.request_many(requests, deadline)
+
+
+def _get_serializers():
+    """
+    Return instances of the configured WAMP serializers that are available,
+    in order of preference; JSON is always available, as the fallback.
+    """
+    serializers = [
+        SERIALIZER_CLASSES[name]()
+            for name in api_ipc_config.SERIALIZERS
+                if SERIALIZER_CLASSES.get(name) is not None]
+    if not any(
+               isinstance(item, serializer.JsonSerializer)
+                   for item in serializers):
+        serializers.append(serializer.JsonSerializer())
+    return serializers
+
+
+# Shared IPC client connection, and the connections to each site's IPC
+# interface (including this one's), by site ID.
+_connection = \
+    Connection(
+        api_ipc_config.REALM,
+        api_ipc_config.ENDPOINT,
+        api_ipc_config.URL,
+        api_ipc_config.SITE_ID)
+_connections = {_connection.site_id: _connection}
+for site_id, site in api_ipc_config.SITES.iteritems():
+    connection = \
+        Connection(
+            site["realm"],
+            site["endpoint"],
+            site.get("url"),
+            site_id)
+    _connections[connection.site_id] = connection
+
+# Sample the connections' pending requests when the metrics are read.
+api_metrics.register_gauge(
+    "ipc.pending",
+    lambda: sum(
+                len(connection.pending)
+                    for connection in _connections.itervalues()))
+
+def start():
+    """
+    Open the shared IPC client connection, and those to the other sites.
+    """
+    for connection in _connections.itervalues():
+        connection.start()
+
+def request(request, progress = None, deadline = None):
+    """
+    Send the specified request via the shared IPC client connection and
+    return a Deferred that fires with the processed response. If an
+    in-progress result procedure is specified, it is invoked with each chunk
+    of a response split into several messages. If a deadline (a time.time()
+    value) is specified, the request fails once it passes.
+    """
+    return _connection.request(request, progress, deadline)
+
+def request_many(requests, deadline = None):
+    """
+    Send the specified requests via the shared IPC client connection and
+    return a list of Deferreds, one for each request, that fire with the
+    processed responses (failing once the deadline, if any, passes).
+    """
+    return _connection.request_many(requests, deadline)
+
+def listen(listener):
+    """
+    Add a listener for the change notifications received via the shared IPC
+    client connection (see NOTIFICATION_RESOURCES); it is invoked with the
+    data URI that changed and the processed notification.
+    """
+    _connection.listeners.append(listener)
+
+def request_sites(request, site_ids, deadline = None):
+    """
+    Send the specified request to the IPC interfaces of the specified sites
+    (a list of site IDs, or "*" for all sites) concurrently, and return a
+    Deferred that fires with the result or error of each site by site ID,
+    under "sites". Each site must respond within api_ipc_config.SITE_TIMEOUT
+    seconds (and by the deadline, if any); the request takes as long as the
+    slowest site.
+
+    Example result:
+        {"sites": {"XX": {"result": ...},
+                   "YY": {"error": "com.lojack.rtu.error.timeout",
+                          "message": "..."}}}
+    """
+    if site_ids == "*":
+        site_ids = sorted(_connections)
+    site_deadline = time.time() + api_ipc_config.SITE_TIMEOUT
+    if deadline is not None:
+        site_deadline = min(site_deadline, deadline)
+    results = []
+    for site_id in site_ids:
+        connection = _connections.get(site_id)
+        if connection is None:
+            results.append(
+                fail(
+                    ApplicationError(
+                        "com.lojack.ipc.error.site_unknown",
+                        "Unknown site '{}'".format(site_id))))
+        else:
+            results.append(
+                connection.request(request, None, site_deadline))
+
+    def collect(results):
+        sites = {}
+        for site_id, (success, value) in zip(site_ids, results):
+            if success:
+                sites[site_id] = {"result": value}
+            elif isinstance(value.value, ApplicationError):
+                sites[site_id] = {
+                    "error": value.value.error,
+                    "message": (value.value.args or [""])[0]}
+            else:
+                sites[site_id] = {
+                    "error": "com.lojack.ipc.error.receive",
+                    "message": value.getErrorMessage()}
+        return {"sites": sites}
 
+    return DeferredList(results, consumeErrors = True).addCallback(collect)
@@ -0,0 +1,59 @@
+# Realm, and the WAMP router transport, used to reach the internal IPC
+# interface (see .crossbar/config.json). ENDPOINT is a Twisted client
+# endpoint description; by default, a Unix domain socket (relative to the
+# router's directory, .crossbar, where the router runs) served by a RawSocket
+# transport, without authentication or compression. To use a WebSocket
+# transport (serving the realm) instead, also specify its URL; for example:
+#     ENDPOINT = "tcp:127.0.0.1:8080"
+#     URL = "ws://127.0.0.1:8080/ipc"
+REALM = "ipc"
+ENDPOINT = "unix:path=ipc.sock"
+URL = None
+
+# ID of the site whose internal IPC interface is reached as above (the site
+# of this WAMP router).
+SITE_ID = "XX"
+
+# Other sites whose internal IPC interfaces can be read from (see the "sites"
+# property of the general data resource's "read" procedure), by site ID: the
+# realm, endpoint and (optional) URL of each, as above; for example:
+#     SITES = {
+#         "YY": {"realm": "ipc", "endpoint": "tcp:10.0.0.2:8081"}}
+SITES = {}
+
+# Time (in seconds) within which each site must respond to a read from
+# several sites; sites that do not are reported as failed.
+SITE_TIMEOUT = 2.0
+
+# WAMP serializers, in order of preference: "msgpack" (MessagePack) and/or
+# "json" (see autobahn.wamp.serializer). All are offered to a WebSocket
+# transport, which uses the first one it supports; a RawSocket transport
+# does not negotiate, and the first one must match its "serializer".
+SERIALIZERS = ["msgpack", "json"]
+
+# Delay (in seconds) before reconnecting a lost IPC client connection; the
+# delay doubles after each failed attempt, up to the maximum.
+RECONNECT_DELAY = 0.5
+RECONNECT_DELAY_MAX = 30.0
+
+# Maximum number of messages held in the IPC server mailbox awaiting
+# publication; messages sent while the mailbox is full are rejected.
+MAILBOX_SIZE = 10000
+
+# Batching of the messages published by the IPC server: the messages
+# received within "interval" seconds of the first are published together, as
+# the arguments of a single event, up to "count" messages or (about) "bytes"
+# bytes of messages per event (no limit if None); messages are published as
+# soon as either limit is reached. With an interval of 0, the messages
+# received in the same reactor turn are published together. If None, each
+# message is published as its own event.
+BATCH = {
+    "interval": 0,
+    "count": 64,
+    "bytes": 65536
+}
+
+# Maximum number of IPC requests awaiting a response, and the time (in
+# seconds) after which a request awaiting a response fails.
+PENDING_SIZE = 4096
+PENDING_EXPIRY = 30.0
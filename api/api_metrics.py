@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+"""
+This module provides low-overhead metrics for the WAMP/WebSocket interface:
+latency histograms and counters recorded on the hot paths, and gauges sampled
+only when the metrics are read.
+
+Exports:
+    Histogram
+        Latency histogram with fixed, exponentially-sized buckets.
+    observe
+        Record a latency in a histogram.
+    increment
+        Increment a counter.
+    register_gauge
+        Register a procedure returning a gauge's current value.
+    snapshot
+        Return the current values of all metrics.
+"""
+
+from __future__ import unicode_literals
+
+# System modules.
+import time
+from bisect import bisect_left
+
+
+# Upper bounds (in seconds) of the histogram buckets: 100 microseconds to
+# about 13 seconds, doubling; a last bucket holds all greater latencies.
+BUCKET_BOUNDS = [0.0001 * 2 ** i for i in range(18)]
+
+
+class Histogram(object):
+
+    """
+    Latency histogram with fixed, exponentially-sized buckets (see
+    BUCKET_BOUNDS), from which approximate percentiles are derived.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.buckets[bisect_left(BUCKET_BOUNDS, value)] += 1
+
+    def percentile(self, fraction):
+        """
+        Return the upper bound of the bucket containing the specified
+        percentile (as a fraction) of the recorded latencies (None if it is
+        in the last, unbounded bucket).
+        """
+        target = self.count * fraction
+        total = 0
+        for i, count in enumerate(self.buckets):
+            total += count
+            if total >= target and total > 0:
+                if i < len(BUCKET_BOUNDS):
+                    return BUCKET_BOUNDS[i]
+                return None
+        return 0.0
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.percentile(0.50),
+            "p99": self.percentile(0.99),
+            "buckets": list(self.buckets)}
+
+
+# Histograms, by metric name and key; for example:
+#     "rpc.proc" -> {"com.lojack.rtu.proc.v1.read": <Histogram>}
+_histograms = {}
+
+# Counters, by metric name and key; for example:
+#     "rpc.errors" -> {"com.lojack.rtu.error.rpc_data_uri_unsupported": 3}
+_counters = {}
+
+# Gauge procedures, by metric name; for example:
+#     "ipc.pending" -> <procedure returning the number of pending requests>
+_gauges = {}
+
+
+def observe(name, key, value):
+    """
+    Record the specified latency (in seconds) in the histogram of the
+    specified metric name and key.
+    """
+    try:
+        _histograms[name][key].observe(value)
+    except KeyError:
+        _histograms.setdefault(name, {}).setdefault(key, Histogram()).observe(
+            value)
+
+def increment(name, key):
+    """
+    Increment the counter of the specified metric name and key.
+    """
+    counters = _counters.setdefault(name, {})
+    counters[key] = counters.get(key, 0) + 1
+
+def register_gauge(name, proc):
+    """
+    Register a procedure (taking no arguments) returning the current value of
+    the gauge of the specified metric name.
+    """
+    _gauges[name] = proc
+
+def snapshot():
+    """
+    Return the current values of all metrics.
+    """
+    return {
+        "time": time.time(),
+        "histograms": dict(
+            (name, dict(
+                (key, histogram.snapshot())
+                    for key, histogram in histograms.iteritems()))
+                for name, histograms in _histograms.iteritems()),
+        "counters": dict(
+            (name, dict(counters))
+                for name, counters in _counters.iteritems()),
+        "gauges": dict(
+            (name, proc())
+                for name, proc in _gauges.iteritems())}
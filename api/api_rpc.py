@@ -61,6 +61,93 @@ api_rpc_config module. This information consists of two main parts:
              uri_config.v2_v1_read
              uri_config.v2_v1_update
 
+     A data resource can also specify a "cache" for the results of its "read"
+     procedures. Results are cached per data URI and procedure parameters for
+     the resource's time-to-live (in seconds), which each sub-resource can
+     override; the least recently used results are discarded once the cache
+     holds "size" results. Concurrent identical reads are coalesced into a
+     single invocation, and "update" and "delete" procedures discard the
+     cached results of the data URI they operate on.
+
+     Slot tables (ex. the data of "com.lojack.rtu.data.v1.general.slots")
+     are cached in a compact form; "read" procedures return the part and
+     format of them requested by the "offset", "count" and "format"
+     properties (see api_slots.py module), which are not part of the
+     results' cache keys.
+
+     A data resource can also specify that changes to its data are
+     published ("publish"): as the rest of the system notifies them, only
+     the changed fields (or slots) of each data URI are published on the
+     corresponding topic URI (see api_changes.py module).
+
+     A data resource can also specify a window (in seconds) within which
+     its "update" procedures are coalesced ("coalesce"): the updates of a
+     data URI that arrive within the window are merged (last write wins,
+     per field of their "data" property) into a single invocation, whose
+     result every caller receives (see api_coalesce.py module).
+
+     A data resource can also specify how its data procedures are executed
+     ("exec"), either for all procedures or per procedure: "inline" (the
+     default) invokes them in the WAMP router's event loop, "thread" in a
+     bounded pool of threads (for procedures that block) and "process" in a
+     bounded pool of processes (for CPU-bound procedures); see the api_exec
+     module. The pools are configured by EXEC_POOLS. Either way, procedures
+     return a Deferred result. Only procedures that return a plain value
+     and use neither the event loop nor Twisted APIs (ex. those of the
+     api_ipc module, which are not thread-safe) may be executed in a pool.
+
+     Example:
+
+         Configuration (rpc_config.py):
+             DATA_PROCS = {"v1": {
+                 "general": {
+                     "data": ["site_id", "slots"],
+                     "procs": {"v1": ["read"]},
+                     "publish": True,
+                     "cache": {"size": 64,
+                               "ttl": 5.0,
+                               "ttl_data": {"site_id": 300.0}}},
+                 "config": {
+                     "procs": {"v1": ["read", "update"]},
+                     "coalesce": 0.05},
+                 "logs": {
+                     "procs": {"v1": ["read"]},
+                     "exec": {"read": "thread"}}}}
+
+Timeouts:
+    Each procedure invocation has a deadline, after which it fails with a
+    "com.lojack.rtu.error.timeout" error and its pending work (ex. an IPC
+    request) is cancelled. The timeout (in seconds) is the caller's, if the
+    procedure data has a "timeout" property (up to TIMEOUT_MAX), otherwise the
+    procedure's default (PROC_TIMEOUTS, or TIMEOUT). Data procedures find the
+    deadline (a time.time() value) in the "deadline" property of their
+    "details" argument, to pass it on (ex. in IPC messages).
+
+    Example subsequent RPC procedure argument:
+        {"uri": "com.lojack.rtu.data.v1.general.slots", "timeout": 2.5}
+
+Registration:
+    The procedures are registered with a WAMP session (see the register
+    procedure) in one of the following modes (REGISTRATION), so that the
+    interface is ready soon after the WAMP router starts:
+
+        "prefix"
+            A single registration matching all procedure URIs by prefix,
+            whose handler invokes the procedure called. Used only if the
+            WAMP libraries support prefix-matching registrations and disclose
+            the URI called; otherwise "concurrent" is used.
+        "concurrent"
+            All procedures are registered at once, without waiting for each
+            registration to complete.
+        "serial"
+            Each procedure is registered once the previous one is.
+
+    The uri_* modules are imported when this module is loaded, not when their
+    data procedures are first invoked. The problems found in the data
+    procedure configuration (ex. a uri_* module that could not be imported)
+    are returned by the preload procedure, which also starts the execution
+    pools in use (see api_exec.py module).
+
 Exports:
     All procedures configured via the api_rpc_config module's PROCS list,
     exported via this module's PROCS list. Each member of this module's PROCS
@@ -98,14 +185,33 @@ In-Progress Results:
             return final_result
 """
 
+from __future__ import unicode_literals
+
 # System modules.
+import logging
 import sys
+import time
+from functools import partial
 
 # WAMP-related modules.
 from autobahn.wamp.exception import ApplicationError
+from autobahn.wamp.types import CallDetails, RegisterOptions
+from twisted.internet import reactor
+from twisted.internet.defer import \
+    CancelledError, Deferred, DeferredList, fail, maybeDeferred
+from twisted.python.failure import Failure
 
 # Local modules.
+import api_cache
+import api_coalesce
+import api_exec
+import api_metrics
 import api_rpc_config
+import api_slots
+import api_trace
+
+
+log = logging.getLogger(__name__)
 
 
 def _exec_proc(proc_version, proc_name, proc_uri, data, details):
@@ -113,6 +219,7 @@ def _exec_proc(proc_version, proc_name, proc_uri, data, details):
     Internal procedure invoked from all exported, dynamically-generated
     RPC procedures.
     """
+    start = time.time()
     # Ensure that a data URI has been specified.
     if not isinstance(data, dict) or \
        not "uri" in data:
@@ -120,128 +227,558 @@ def _exec_proc(proc_version, proc_name, proc_uri, data, details):
                   "com.lojack.rtu.error.rpc_data_uri_missing",
                   "RPC calls must specify a dictionary with a 'uri' "
                       "property specifying a data URI")
-    # Ensure that the specified data URI is supported (defined in the RPC
-    # configuration).
-    for data_version, \
-        data_resources_info in api_rpc_config.DATA_PROCS.iteritems():
-        # ex. data_version = "v2",
-        #     data_resources_info =
-        #         {"config": {"procs": {"v1": ["read", "update"]}}}
-        for data_resource_name, \
-            data_resource_info in data_resources_info.iteritems():
-            # ex. data_resource_name = "config",
-            #     data_resource_info =
-            #         {"procs": {"v1": ["read", "update"]}}
-            data_uri = \
-                ".".join([
-                    api_rpc_config.DATA_URI_PREFIX,
-                    data_version,
-                    data_resource_name])
-            if data_uri != data["uri"]:
-                if "data" in data_resource_info:
-                    # This resource contains "sub-resources" that could match
-                    # the specified data URI; for example:
-                    # "com.lojack.rtu.data.v2.general.site_id"
-                    #                         ^^^^^^^ ^^^^^^^
-                    #                         main    sub-resource
-                    for data_resource_name_sub in data_resource_info["data"]:
-                        data_uri = \
-                            ".".join([
-                                api_rpc_config.DATA_URI_PREFIX,
-                                data_version,
-                                data_resource_name,
-                                data_resource_name_sub])
-                        if data_uri == data["uri"]:
-                            break
-            # ex. data_uri = "com.lojack.rtu.data.v2.config"
-            if data_uri == data["uri"]:
-                # Found the specified data URI in the internal configuration;
-                # ensure the configuration indicates this procedure is
-                # supported for this data URI.
-                for data_proc_version, \
-                    data_proc_names in data_resource_info["procs"].iteritems():
-                    if proc_version == data_proc_version and \
-                        proc_name in data_proc_names:
-                        # This procedure is supported for this data URI; import
-                        # the module and ensure it implements the procedure.
-                        try:
-                            print "Dynamically importing 'uri_{}' module".format(
-                                      data_resource_name)
-                            data_proc_module = \
-                                __import__("uri_" + data_resource_name)
-                        except Exception as e:
-                            raise ApplicationError(
-                                      "com.lojack.rtu.error.rpc_module_import",
-                                      "Could not import the 'uri_{}' module "
-                                          "(data URI: '{}'): "
-                                          "{}".format(
-                                              data_resource_name,
-                                              data_uri,
-                                              str(e)))
-                        data_proc_name_versioned = \
-                            "_".join([
-                                "data",
-                                data_version,
-                                "proc",
-                                proc_version,
-                                proc_name])
-                        if hasattr(data_proc_module, data_proc_name_versioned):
-                            # The procedure is implemented; invoke it, passing
-                            # along the specified data (and possible in-progress
-                            # results enabler), and return the result.
-                            print "Invoking 'uri_{}.{}' method; " \
-                                      " data = {}".format(
-                                          data_resource_name,
-                                          data_proc_name_versioned,
-                                          data)
-                            return getattr(
-                                       data_proc_module,
-                                       data_proc_name_versioned)(
-                                           data,
-                                           details)
-                        raise ApplicationError(
-                                  "com.lojack.rtu.error.rpc_not_implemented",
-                                  "Could not process the data URI '{}' "
-                                      "for the '{}' procedure: A '{}' "
-                                      "procedure is not implemented in the "
-                                      "'uri_{}' module".format(
-                                          data_uri,
-                                          proc_uri,
-                                          data_proc_name_versioned,
-                                          data_resource))
-                raise ApplicationError(
-                          "com.lojack.rtu.error.rpc_not_implemented",
-                          "Could not process the data URI '{}' "
-                              "for the '{}' procedure: A '{}' '{}'"
-                              "procedure is not specified in the internal "
-                              "RPC configuration for the '{}' module".format(
-                                  data_uri,
-                                  proc_uri,
-                                  proc_version,
-                                  proc_name,
-                                  data_resource))
-    raise ApplicationError(
-              "com.lojack.rtu.error.rpc_data_uri_unsupported",
-              "Data URI '{}' is not supported by the "
-                  "'{}' procedure".format(
-                      data["uri"],
-                      proc_uri))
+    # Look up the data procedure for this procedure and data URI in the
+    # dispatch table built when this module was loaded (see below).
+    try:
+        data_proc = _DISPATCH[(proc_version, proc_name, data["uri"])]
+    except (KeyError, TypeError):
+        raise ApplicationError(
+                  "com.lojack.rtu.error.rpc_data_uri_unsupported",
+                  "Data URI '{}' is not supported by the "
+                      "'{}' procedure".format(
+                          data["uri"],
+                          proc_uri))
+    # Invoke the data procedure, passing along the specified data (and
+    # possible in-progress results enabler), and return the result.
+    log.debug(
+        "Invoking '%s.%s' method; data = %s",
+        data_proc.__module__,
+        data_proc.__name__,
+        data)
+    return _exec_data_proc_traced(
+               proc_uri,
+               data["uri"],
+               start,
+               _exec_data_proc,
+               proc_name,
+               data_proc,
+               data,
+               details)
+
+def _exec_data_proc_traced(proc_uri, data_uri, start, proc, *args):
+    """
+    Internal procedure to invoke the specified procedure (which invokes data
+    procedures) with the specified arguments, as part of a new trace, if
+    sampled (see api_trace.py module). The trace ID is current while the
+    procedure is invoked, so that the data procedures can carry it onwards;
+    the "rpc.dispatch" span covers the invocation and the "rpc.result" span
+    the whole RPC invocation, until its result.
+    """
+    trace_id = api_trace.start()
+    if trace_id is None:
+        return proc(*args)
+    api_trace.current = trace_id
+    try:
+        d = proc(*args)
+    finally:
+        api_trace.current = None
+    attributes = {
+        "proc_uri": proc_uri,
+        "data_uri": data_uri}
+    api_trace.record(
+        trace_id,
+        "rpc.dispatch",
+        start,
+        time.time(),
+        **attributes)
+    return d.addBoth(
+               _trace,
+               trace_id,
+               "rpc.result",
+               start,
+               attributes)
+
+def _exec_data_proc(proc_name, data_proc, data, details):
+    """
+    Internal procedure to invoke the specified data procedure for the
+    specified procedure data, through the data URI's result cache (if any).
+    Returns a Deferred that fires with the result; the result of a "read"
+    procedure is the view of it requested (see api_slots.py module).
+    """
+    start = time.time()
+    d = _exec_data_proc_cached(
+            proc_name,
+            data_proc,
+            data,
+            details)
+    if proc_name == "read":
+        d.addCallback(api_slots.view, data)
+    return d.addBoth(
+               _observe,
+               "rpc.data",
+               data["uri"],
+               start)
+
+def _exec_data_proc_cached(proc_name, data_proc, data, details):
+    """
+    Internal procedure to invoke the specified data procedure for the
+    specified procedure data, through the data URI's result cache (if any).
+    """
+    cache_info = _CACHES.get(data["uri"])
+    if cache_info is None:
+        return _exec_data_proc_coalesced(proc_name, data_proc, data, details)
+    cache, ttl = cache_info
+    if proc_name == "read":
+        # Serve the result from the data URI's cache, unless the caller
+        # requested in-progress results.
+        if details is not None and details.progress:
+            return maybeDeferred(data_proc, data, details)
+        return cache.get(
+                   _cache_key(data),
+                   ttl,
+                   _exec_data_proc_shared,
+                   data_proc,
+                   data,
+                   details)
+    if proc_name in ("update", "delete"):
+        # Discard the data URI's cached results, both now and once the data
+        # has been changed.
+        def invalidate(result):
+            cache.invalidate(data["uri"])
+            return result
+        invalidate(None)
+        return _exec_data_proc_coalesced(
+                   proc_name,
+                   data_proc,
+                   data,
+                   details).addBoth(invalidate)
+    return _exec_data_proc_coalesced(proc_name, data_proc, data, details)
+
+def _strip_call_fields(result):
+    """
+    Internal procedure to return the specified result without the properties
+    of the IPC messages it was read from that are specific to the call (ex.
+    its deadline), including those of each site's result (see
+    uri_general.py module).
+    """
+    if not isinstance(result, dict):
+        return result
+    result = dict(
+        (name, value)
+            for name, value in result.iteritems()
+                if name not in _CALL_FIELDS)
+    if isinstance(result.get("sites"), dict):
+        result["sites"] = dict(
+            (site_id, dict(site, result = _strip_call_fields(site["result"]))
+                          if isinstance(site, dict) and "result" in site
+                          else site)
+                for site_id, site in result["sites"].iteritems())
+    return result
+
+def _exec_data_proc_shared(data_proc, data, details):
+    """
+    Internal procedure to invoke the specified data procedure for a result
+    that is shared by several calls (ex. cached), and so has none of the
+    call-specific properties of the call that produced it.
+    """
+    return maybeDeferred(data_proc, data, details).addCallback(
+               _strip_call_fields)
+
+def _exec_data_proc_coalesced(proc_name, data_proc, data, details):
+    """
+    Internal procedure to invoke the specified data procedure for the
+    specified procedure data, merged with other updates of the data URI (if
+    it is an "update" procedure and the data URI's updates are coalesced).
+    """
+    coalescer = _COALESCERS.get(data["uri"])
+    if proc_name != "update" or coalescer is None:
+        return maybeDeferred(data_proc, data, details)
+    return coalescer.submit(data_proc, data, details)
+
+def _exec_proc_read_many(proc_version, proc_name, proc_uri, data, details):
+    """
+    Internal procedure invoked from the exported "read_many" RPC procedures
+    (instead of _exec_proc). Reads each of a list of data URIs concurrently,
+    as the corresponding "read" procedure would, and returns a dictionary of
+    the result or error for each data URI. Reads handled by a data procedure
+    that has a batch counterpart (ex. "data_v1_proc_v1_read_many" for
+    "data_v1_proc_v1_read") are passed to the batch procedure together, so
+    that they can be combined into a single request to the rest of the
+    system.
+
+    Example subsequent RPC procedure argument:
+        {"uris": ["com.lojack.rtu.data.v1.general.site_id",
+                  {"uri": "com.lojack.rtu.data.v1.general.slots"}]}
+
+    Example result:
+        {"com.lojack.rtu.data.v1.general.site_id": {"result": ...},
+         "com.lojack.rtu.data.v1.general.slots": {
+             "error": "com.lojack.rtu.error.rpc_not_implemented",
+             "message": "..."}}
+    """
+    start = time.time()
+    # Ensure that a list of data URIs has been specified.
+    if not isinstance(data, dict) or \
+       not isinstance(data.get("uris"), list):
+        raise ApplicationError(
+                  "com.lojack.rtu.error.rpc_data_uri_missing",
+                  "RPC calls must specify a dictionary with a 'uris' "
+                      "property specifying a list of data URIs")
+    return _exec_data_proc_traced(
+               proc_uri,
+               data["uris"],
+               start,
+               _exec_data_procs_read_many,
+               proc_version,
+               proc_name,
+               proc_uri,
+               data,
+               details)
+
+def _exec_data_procs_read_many(
+        proc_version,
+        proc_name,
+        proc_uri,
+        data,
+        details):
+    """
+    Internal procedure to invoke the data procedures for the reads of the
+    specified "read_many" procedure data (see _exec_proc_read_many).
+    """
+    read_proc_name = proc_name[:-len("_many")]
+    read_proc_uri = proc_uri[:-len("_many")]
+    # Reads to be passed to each batch procedure: data procedure ->
+    # [(procedure data, Deferred for the read's result)]. Reads made once
+    # the batch procedures have been invoked (ex. retried by a result cache,
+    # see api_cache.py module) are passed to the data procedure itself.
+    batches = {}
+    dispatched = []
+
+    def read_batched(data_proc, data_item, details):
+        if dispatched:
+            return data_proc(data_item, details)
+        d = Deferred()
+        batches.setdefault(data_proc, []).append((data_item, d))
+        return d
+
+    data_uris = []
+    reads = []
+    for data_item in data["uris"]:
+        if not isinstance(data_item, dict):
+            data_item = {"uri": data_item}
+        data_uris.append(unicode(data_item.get("uri")))
+        try:
+            data_proc = \
+                _DISPATCH[(proc_version, read_proc_name, data_item["uri"])]
+        except (KeyError, TypeError):
+            reads.append(
+                fail(
+                    ApplicationError(
+                        "com.lojack.rtu.error.rpc_data_uri_unsupported",
+                        "Data URI '{}' is not supported by the "
+                            "'{}' procedure".format(
+                                data_item.get("uri"),
+                                read_proc_uri))))
+            continue
+        if data_proc in _DISPATCH_MANY:
+            data_proc = partial(read_batched, data_proc)
+        reads.append(
+            maybeDeferred(
+                _exec_data_proc,
+                read_proc_name,
+                data_proc,
+                data_item,
+                details))
+    # Invoke each batch procedure for its reads (those not served from a
+    # result cache); each returns a Deferred result for each read.
+    dispatched.append(True)
+    for data_proc, batch in batches.iteritems():
+        try:
+            results = \
+                _DISPATCH_MANY[data_proc](
+                    [data_item for data_item, d in batch],
+                    details)
+        except Exception:
+            results = [fail() for data_item, d in batch]
+        for (data_item, d), result in zip(batch, results):
+            result.chainDeferred(d)
+
+    def collect(results):
+        result = {}
+        for data_uri, (success, value) in zip(data_uris, results):
+            if success:
+                result[data_uri] = {"result": value}
+            elif isinstance(value.value, ApplicationError):
+                result[data_uri] = {
+                    "error": value.value.error,
+                    "message": (value.value.args or [""])[0]}
+            else:
+                result[data_uri] = {
+                    "error": "com.lojack.rtu.error.rpc_failed",
+                    "message": value.getErrorMessage()}
+        return result
+
+    return DeferredList(reads, consumeErrors = True).addCallback(collect)
+
+def _exec_proc_metrics(proc_version, proc_name, proc_uri, data, details):
+    """
+    Internal procedure invoked from the exported "metrics" RPC procedures
+    (instead of _exec_proc). Returns the current values of the metrics (see
+    api_metrics.py module); no data URI is needed.
+    """
+    return api_metrics.snapshot()
+
+def _observe(result, name, key, start):
+    """
+    Internal procedure to record the latency of a procedure started at the
+    specified time, once it has completed with the specified result (which
+    is passed through).
+    """
+    api_metrics.observe(name, key, time.time() - start)
+    return result
+
+def _trace(result, trace_id, span, start, attributes):
+    """
+    Internal procedure to record a span of the specified trace, started at
+    the specified time, once it has completed with the specified result
+    (which is passed through).
+    """
+    if isinstance(result, Failure):
+        attributes = dict(attributes)
+        attributes["error"] = \
+            result.value.error \
+                if isinstance(result.value, ApplicationError) \
+                else "com.lojack.rtu.error.rpc_failed"
+    api_trace.record(trace_id, span, start, time.time(), **attributes)
+    return result
+
+def _observe_proc(result, proc_uri, start):
+    """
+    Internal procedure to record the latency of an exported procedure and,
+    if it failed, the error.
+    """
+    _observe(result, "rpc.proc", proc_uri, start)
+    if isinstance(result, Failure):
+        if isinstance(result.value, ApplicationError):
+            api_metrics.increment("rpc.errors", result.value.error)
+        else:
+            api_metrics.increment(
+                "rpc.errors",
+                "com.lojack.rtu.error.rpc_failed")
+    return result
+
+def _cache_key(data):
+    """
+    Internal procedure to create the cache key for the specified procedure
+    data: the data URI and the procedure's other parameters.
+    """
+    return (
+        data["uri"],
+        tuple(sorted(
+            (name, repr(value))
+                for name, value in data.iteritems()
+                    if name not in ("uri", "timeout") and
+                       name not in api_slots.VIEW_PARAMS)))
+
+def cache_stats():
+    """
+    Return the hit and miss counters and sizes of the result caches, by
+    data resource URI.
+    """
+    return dict(
+        (data_uri, cache.stats())
+            for data_uri, cache in _CACHES_BY_RESOURCE.iteritems())
+
+def invalidate(data_uri):
+    """
+    Discard the cached results (if any) for the specified data URI, for
+    example once the rest of the system notifies that its data changed.
+    """
+    cache_info = _CACHES.get(data_uri)
+    if cache_info is not None:
+        cache_info[0].invalidate(data_uri)
+
+def get_timeout(proc_uri, data):
+    """
+    Return the timeout (in seconds) of an invocation of the specified
+    procedure with the specified procedure data: the caller's, if specified
+    (up to the maximum), otherwise the procedure's default.
+    """
+    timeout = data.get("timeout") if isinstance(data, dict) else None
+    if isinstance(timeout, (int, long, float)) and \
+       not isinstance(timeout, bool) and \
+       timeout > 0:
+        return min(timeout, api_rpc_config.TIMEOUT_MAX)
+    proc_version, proc_name = proc_uri.split(".")[-2:]
+    return api_rpc_config.PROC_TIMEOUTS.get(
+               proc_version,
+               {}).get(
+                   proc_name,
+                   api_rpc_config.TIMEOUT)
+
+def set_timeout(d, timeout, proc_uri):
+    """
+    Cancel the specified Deferred (the result of an invocation of the
+    specified procedure) if it has not fired within the specified timeout (in
+    seconds), failing it with a "com.lojack.rtu.error.timeout" error instead.
+    Returns the Deferred.
+    """
+    timer = reactor.callLater(timeout, d.cancel)
+
+    def timed_out(result):
+        if timer.active():
+            timer.cancel()
+        elif isinstance(result, Failure) and \
+             result.check(CancelledError):
+            return Failure(
+                       ApplicationError(
+                           "com.lojack.rtu.error.timeout",
+                           "The '{}' procedure did not complete within {} "
+                               "seconds".format(
+                                   proc_uri,
+                                   timeout)))
+        return result
+
+    return d.addBoth(timed_out)
+
+def _add_problem(message):
+    if message not in _PROBLEMS:
+        _PROBLEMS.append(message)
+
+def preload():
+    """
+    Start the execution pools used by the data procedures, so that no
+    invocation waits for one to start, and return the problems found in the
+    data procedure configuration (a list of messages).
+    """
+    for executor in _EXECUTORS_USED:
+        executor.start()
+    return list(_PROBLEMS)
+
+def _register_failed(failure, uri):
+    return Failure(
+               ApplicationError(
+                   "com.lojack.rtu.error.register_proc",
+                   "Could not register procedure for URI '{}': {}".format(
+                       uri,
+                       failure.getErrorMessage())))
+
+def _register_prefix(session, procs, options, prefix):
+    """
+    Register the specified procedures with a single registration matching
+    the specified URI prefix (see register). Returns None if the WAMP
+    libraries do not support it.
+    """
+    try:
+        register_options = RegisterOptions(match = "prefix", **options)
+    except TypeError:
+        return None
+    procs_by_uri = dict(procs)
+    details_arg = options.get("details_arg", "details")
+
+    def _proc_demux(*args, **kwargs):
+        uri = getattr(kwargs.get(details_arg), "procedure", None)
+        if uri not in procs_by_uri:
+            raise ApplicationError(
+                      ApplicationError.NO_SUCH_PROCEDURE,
+                      "No procedure registered for URI '{}'".format(uri))
+        return procs_by_uri[uri](*args, **kwargs)
+
+    return session.register(
+               _proc_demux,
+               prefix,
+               register_options).addCallbacks(
+                   lambda registration: [(prefix, registration)],
+                   _register_failed,
+                   errbackArgs = (prefix,))
+
+def register(session, procs, options, prefix):
+    """
+    Register the specified procedures ((URI, procedure) pairs, whose URIs
+    share the specified prefix) with the specified WAMP session, with the
+    specified registration options (RegisterOptions keyword arguments), in
+    the configured mode (see the "Registration" section above). Returns a
+    Deferred that fires with a list of (URI, registration) pairs, or fails
+    with a "com.lojack.rtu.error.register_proc" error.
+    """
+    mode = api_rpc_config.REGISTRATION
+    if mode == "prefix":
+        d = _register_prefix(session, procs, options, prefix)
+        if d is not None:
+            return d
+        log.info(
+            "Prefix-matching registrations are not supported; registering "
+            "%d procedures concurrently",
+            len(procs))
+        mode = "concurrent"
+    register_options = RegisterOptions(**options)
+
+    def register_proc(result, uri, proc):
+        return session.register(
+                   proc,
+                   uri,
+                   register_options).addCallbacks(
+                       lambda registration: (uri, registration),
+                       _register_failed,
+                       errbackArgs = (uri,))
+
+    if mode == "serial":
+        registrations = []
+        d = Deferred()
+        for uri, proc in procs:
+            d.addCallback(register_proc, uri, proc)
+            d.addCallback(registrations.append)
+        d.addCallback(lambda result: registrations)
+        d.callback(None)
+        return d
+    return DeferredList(
+               [register_proc(None, uri, proc) for uri, proc in procs],
+               fireOnOneErrback = True,
+               consumeErrors = True).addCallbacks(
+                   lambda results: [result for success, result in results],
+                   lambda failure: failure.value.subFailure)
 
 def _make_proc(proc_version, proc_name, proc_uri):
     """
     Internal procedure to dynamically create a procedure with a versioned
     name, to be associated with the specified procedure URI.
     """
-    # Create a closure and name it with the versioned procedure name.
+    # Create a closure and name it with the versioned procedure name. The
+    # procedure is handled by _exec_proc, unless this module implements a
+    # procedure specifically for it (ex. _exec_proc_read_many).
+    exec_proc = globals().get("_exec_proc_" + proc_name, _exec_proc)
     def _proc_template(data, details = None):
-        return _exec_proc(proc_version, proc_name, proc_uri, data, details)
-    _proc_template.__name__ = "_".join([proc_version, proc_name])
+        start = time.time()
+        timeout = get_timeout(proc_uri, data)
+        if details is None:
+            details = CallDetails()
+        details.deadline = start + timeout
+        return set_timeout(
+                   maybeDeferred(
+                       exec_proc,
+                       proc_version,
+                       proc_name,
+                       proc_uri,
+                       data,
+                       details),
+                   timeout,
+                   proc_uri).addBoth(
+                       _observe_proc,
+                       proc_uri,
+                       start)
+    _proc_template.__name__ = str("_".join([proc_version, proc_name]))
     return _proc_template
 
+def _make_data_proc_error(error_uri, error_message):
+    """
+    Internal procedure to create a dispatch table entry for a procedure and
+    data URI combination that cannot be processed; invoking the entry raises
+    the specified error.
+    """
+    def _data_proc_error(data, details = None):
+        raise ApplicationError(error_uri, error_message)
+    _data_proc_error.__name__ = str("_data_proc_error")
+    return _data_proc_error
+
 
 # Procedures exported from this module.
 PROCS = []
 
+# Properties of the IPC messages that results are read from that are specific
+# to the call (see api_ipc.py module); results shared by several calls (ex.
+# cached) do not have them.
+_CALL_FIELDS = frozenset(["deadline", "request_id", "reply_to", "trace_id"])
+
 # Create the procedures to be exported from this module, based on the
 # configuration.
 this_module = sys.modules[__name__]
@@ -279,3 +816,220 @@ for proc_version, proc_names in api_rpc_config.PROCS.iteritems():
                         proc_name_versioned),
             "uri": proc_uri})
 
+
+# Dispatch table mapping each (procedure version, procedure name, data URI)
+# combination to the data procedure that processes it; for example:
+#     ("v1", "read", "com.lojack.rtu.data.v1.general.site_id") ->
+#         uri_general.data_v1_proc_v1_read
+# Every configured data URI has an entry for every exported procedure, so
+# combinations that are unsupported or unimplemented are detected here, once,
+# and map to a data procedure that raises the appropriate error. Any data URI
+# not in the table is unsupported.
+_DISPATCH = {}
+
+# Batch counterparts of the data procedures in the dispatch table that have
+# one, by data procedure; for example:
+#     uri_general.data_v1_proc_v1_read -> uri_general.data_v1_proc_v1_read_many
+# A batch procedure takes a list of procedure data (instead of a single
+# procedure data) and returns a list of Deferred results, one for each.
+_DISPATCH_MANY = {}
+
+# Result caches of the data resources configured with a "cache" (see
+# api_rpc_config.py module), by data resource URI, and the cache and
+# time-to-live of results for each data URI of those resources; for example:
+#     "com.lojack.rtu.data.v1.general.site_id" -> (<api_cache.Cache>, 300.0)
+_CACHES_BY_RESOURCE = {}
+_CACHES = {}
+
+# Problems found in the data procedure configuration while building the
+# dispatch table (see preload), and the executors used by data procedures.
+_PROBLEMS = []
+_EXECUTORS_USED = set()
+
+# Coalescers of the updates of the data resources configured with
+# "coalesce", by data URI (see api_coalesce.py module).
+_COALESCERS = {}
+
+# Executors of the data procedures not invoked inline, by execution mode (see
+# api_exec.py and api_rpc_config.py modules).
+_EXECUTORS = {
+    "inline": None,
+    "thread": api_exec.ThreadPoolExecutor(
+                  "thread",
+                  api_rpc_config.EXEC_POOLS["thread"]["size"],
+                  api_rpc_config.EXEC_POOLS["thread"]["queue_size"]),
+    "process": api_exec.ProcessPoolExecutor(
+                   "process",
+                   api_rpc_config.EXEC_POOLS["process"]["size"],
+                   api_rpc_config.EXEC_POOLS["process"]["queue_size"],
+                   api_rpc_config.EXEC_POOLS["process"]["timeout"])}
+
+for data_version, \
+    data_resources_info in api_rpc_config.DATA_PROCS.iteritems():
+    # ex. data_version = "v2",
+    #     data_resources_info =
+    #         {"config": {"procs": {"v1": ["read", "update"]}}}
+    for data_resource_name, \
+        data_resource_info in data_resources_info.iteritems():
+        # ex. data_resource_name = "config",
+        #     data_resource_info =
+        #         {"procs": {"v1": ["read", "update"]}}
+        data_uri = \
+            ".".join([
+                api_rpc_config.DATA_URI_PREFIX,
+                data_version,
+                data_resource_name])
+        # ex. data_uri = "com.lojack.rtu.data.v2.config"
+        data_uris = [data_uri]
+        # This resource may contain "sub-resources"; for example:
+        # "com.lojack.rtu.data.v2.general.site_id"
+        #                         ^^^^^^^ ^^^^^^^
+        #                         main    sub-resource
+        for data_resource_name_sub in data_resource_info.get("data", []):
+            data_uris.append(
+                ".".join([
+                    data_uri,
+                    data_resource_name_sub]))
+        # Create the resource's result cache, if configured; each of its
+        # data URIs may override the resource's result time-to-live.
+        if "cache" in data_resource_info:
+            cache_info = data_resource_info["cache"]
+            cache = api_cache.Cache(cache_info["size"])
+            _CACHES_BY_RESOURCE[data_uri] = cache
+            _CACHES[data_uri] = (cache, cache_info["ttl"])
+            for data_resource_name_sub in data_resource_info.get("data", []):
+                _CACHES[".".join([data_uri, data_resource_name_sub])] = (
+                    cache,
+                    cache_info.get("ttl_data", {}).get(
+                        data_resource_name_sub,
+                        cache_info["ttl"]))
+        # Create the resource's update coalescer, if configured.
+        if "coalesce" in data_resource_info:
+            coalescer = api_coalesce.Coalescer(data_resource_info["coalesce"])
+            for data_uri_coalesced in data_uris:
+                _COALESCERS[data_uri_coalesced] = coalescer
+        # Import the module implementing the data procedures for this
+        # resource.
+        try:
+            data_proc_module = __import__("uri_" + data_resource_name)
+            data_proc_module_error = None
+        except Exception as e:
+            data_proc_module = None
+            data_proc_module_error = str(e)
+            _add_problem(
+                "Could not import the 'uri_{}' module: {}".format(
+                    data_resource_name,
+                    data_proc_module_error))
+        for proc_version, proc_names in api_rpc_config.PROCS.iteritems():
+            data_proc_names = \
+                data_resource_info["procs"].get(
+                    proc_version,
+                    [])
+            for proc_name in proc_names:
+                proc_uri = \
+                    ".".join([
+                        api_rpc_config.PROC_URI_PREFIX,
+                        proc_version,
+                        proc_name])
+                data_proc_name_versioned = \
+                    "_".join([
+                        "data",
+                        data_version,
+                        "proc",
+                        proc_version,
+                        proc_name])
+                # ex. data_proc_name_versioned = "data_v2_proc_v1_read"
+                data_proc_exec = data_resource_info.get("exec", "inline")
+                if isinstance(data_proc_exec, dict):
+                    data_proc_exec = data_proc_exec.get(proc_name, "inline")
+                # ex. data_proc_exec = "thread"
+                for data_uri in data_uris:
+                    if proc_name not in data_proc_names:
+                        data_proc = \
+                            _make_data_proc_error(
+                                "com.lojack.rtu.error.rpc_not_implemented",
+                                "Could not process the data URI '{}' "
+                                    "for the '{}' procedure: A '{}' '{}' "
+                                    "procedure is not specified in the "
+                                    "internal RPC configuration for the "
+                                    "'uri_{}' module".format(
+                                        data_uri,
+                                        proc_uri,
+                                        proc_version,
+                                        proc_name,
+                                        data_resource_name))
+                    elif data_proc_module is None:
+                        data_proc = \
+                            _make_data_proc_error(
+                                "com.lojack.rtu.error.rpc_module_import",
+                                "Could not import the 'uri_{}' module "
+                                    "(data URI: '{}'): {}".format(
+                                        data_resource_name,
+                                        data_uri,
+                                        data_proc_module_error))
+                    elif not hasattr(
+                                 data_proc_module,
+                                 data_proc_name_versioned):
+                        _add_problem(
+                            "The '{}' procedure is not implemented in the "
+                                "'uri_{}' module".format(
+                                    data_proc_name_versioned,
+                                    data_resource_name))
+                        data_proc = \
+                            _make_data_proc_error(
+                                "com.lojack.rtu.error.rpc_not_implemented",
+                                "Could not process the data URI '{}' "
+                                    "for the '{}' procedure: A '{}' "
+                                    "procedure is not implemented in the "
+                                    "'uri_{}' module".format(
+                                        data_uri,
+                                        proc_uri,
+                                        data_proc_name_versioned,
+                                        data_resource_name))
+                    elif data_proc_exec not in _EXECUTORS:
+                        _add_problem(
+                            "Execution mode '{}' of the '{}' procedure is "
+                                "not supported".format(
+                                    data_proc_exec,
+                                    data_proc_name_versioned))
+                        data_proc = \
+                            _make_data_proc_error(
+                                "com.lojack.rtu.error.rpc_exec_unsupported",
+                                "Could not process the data URI '{}' "
+                                    "for the '{}' procedure: Execution "
+                                    "mode '{}' is not supported".format(
+                                        data_uri,
+                                        proc_uri,
+                                        data_proc_exec))
+                    elif data_proc_exec != "inline":
+                        _EXECUTORS_USED.add(_EXECUTORS[data_proc_exec])
+                        data_proc = \
+                            _EXECUTORS[data_proc_exec].wrap(
+                                getattr(
+                                    data_proc_module,
+                                    data_proc_name_versioned))
+                    else:
+                        data_proc = \
+                            getattr(
+                                data_proc_module,
+                                data_proc_name_versioned)
+                        if hasattr(
+                               data_proc_module,
+                               data_proc_name_versioned + "_many"):
+                            _DISPATCH_MANY[data_proc] = \
+                                getattr(
+                                    data_proc_module,
+                                    data_proc_name_versioned + "_many")
+                    _DISPATCH[(proc_version, proc_name, data_uri)] = data_proc
+
+
+# Sample the result caches and execution pools when the metrics are read.
+api_metrics.register_gauge(
+    "rpc.cache",
+    cache_stats)
+api_metrics.register_gauge(
+    "rpc.exec",
+    lambda: dict(
+        (data_proc_exec, executor.in_progress)
+            for data_proc_exec, executor in _EXECUTORS.iteritems()
+                if executor is not None))
@@ -2,19 +2,29 @@ URI_PREFIX = "com.lojack.rtu"
 
 PROC_URI_PREFIX = ".".join([URI_PREFIX, "proc"])
 
+TOPIC_URI_PREFIX = ".".join([URI_PREFIX, "topic"])
+
 PROCS = {
     "v1": [
         "create",
         "read",
+        "read_many",
         "update",
         "delete",
         "shutdown",
         "restart",
-        "flush"
+        "flush",
+        "metrics"
     ]
 }
 
 
+# How the procedures are registered with the WAMP router: "prefix",
+# "concurrent" or "serial" (see the "Registration" section of the api_rpc
+# module).
+REGISTRATION = "prefix"
+
+
 DATA_URI_PREFIX = ".".join([URI_PREFIX, "data"])
 
 DATA_PROCS = {
@@ -25,7 +35,8 @@ DATA_PROCS = {
                     "read",
                     "update"
                 ]
-            }
+            },
+            "coalesce": 0.05
         },
         "general": {
             "data": [
@@ -38,8 +49,119 @@ DATA_PROCS = {
                 "v1": [
                     "read"
                 ]
+            },
+            "publish": True,
+            "cache": {
+                "size": 64,
+                "ttl": 5.0,
+                "ttl_data": {
+                    "site_id": 300.0,
+                    "site_description": 300.0
+                }
             }
         }
     }
 }
 
+
+
+# Fields of each slot of a slot table (ex. the data of the
+# "com.lojack.rtu.data.v1.general.slots" data URI), as [name, struct format
+# character] pairs; slot tables are stored compactly as fixed-width records of
+# these fields, unless their slots have other fields (see api_slots.py
+# module).
+SLOT_FIELDS = [
+    ["slot", "H"],
+    ["state", "B"],
+    ["occupied", "?"],
+    ["vehicle_id", "I"],
+    ["updated", "d"]
+]
+
+
+# Pools in which data procedures can be executed instead of inline (see the
+# "exec" property of the DATA_PROCS data resources): the maximum number of
+# threads/processes, and of invocations waiting for one; invocations beyond
+# these fail immediately. Invocations in the process pool whose result is not
+# received within "timeout" seconds (ex. if their process dies) fail.
+EXEC_POOLS = {
+    "thread": {
+        "size": 4,
+        "queue_size": 64
+    },
+    "process": {
+        "size": 2,
+        "queue_size": 16,
+        "timeout": 60.0
+    }
+}
+
+
+# Topic on which the metrics (see the "metrics" procedure) are published,
+# every METRICS_INTERVAL seconds. Not under the "v1" topics, which are
+# available to all roles.
+METRICS_TOPIC_URI = ".".join([TOPIC_URI_PREFIX, "admin", "v1", "metrics"])
+METRICS_INTERVAL = 10.0
+
+# Level of the messages logged by the WAMP/WebSocket interface (see the
+# logging module); debug messages are logged for every procedure invocation.
+LOG_LEVEL = "WARNING"
+
+# Proportion (0.0 to 1.0) of RPC invocations traced end-to-end (see the
+# api_trace module), and the local file to which their spans are written, one
+# per process ("{pid}" is replaced by the process ID, as the WAMP router and
+# its workers share a working directory); it is rotated once it holds
+# TRACE_FILE_SIZE bytes, keeping TRACE_FILE_COUNT previous files.
+TRACE_SAMPLE_RATE = 0.01
+TRACE_FILE = "api_trace.{pid}.log"
+TRACE_FILE_SIZE = 10 * 1024 * 1024
+TRACE_FILE_COUNT = 5
+
+# Worker processes (see the api_worker module and .crossbar/config.json, which
+# lists a container worker for each) register the procedures under URIs
+# with this prefix; each invocation is forwarded to one of them, chosen by
+# WORKER_POLICY: "roundrobin" or "random".
+WORKER_URI_PREFIX = ".".join([URI_PREFIX, "worker"])
+WORKER_POLICY = "roundrobin"
+
+# Admission control of the procedure invocations (see the api_admission
+# module): the maximum number of invocations in progress, globally, per role
+# and per caller session; the maximum number of invocations waiting for
+# global capacity, and the time (in seconds) for which they wait; and the
+# roles whose invocations are admitted first. Invocations beyond these fail
+# with a "com.lojack.rtu.error.overloaded" error.
+ADMISSION = {
+    "in_flight": 512,
+    "in_flight_role": {
+        "ljop": 256
+    },
+    "in_flight_session": 64,
+    "queue_size": 256,
+    "queue_timeout": 2.0,
+    "priority_roles": [
+        "ljadmin"
+    ]
+}
+
+# Time (in seconds) within which procedure invocations must complete, by
+# default and per procedure, and the maximum timeout a caller can specify
+# (see the "Timeouts" section of the api_rpc module).
+TIMEOUT = 10.0
+PROC_TIMEOUTS = {
+    "v1": {
+        "read": 5.0,
+        "read_many": 10.0,
+        "metrics": 5.0
+    }
+}
+TIMEOUT_MAX = 60.0
+
+# HTTP read bridge (see the api_bridge module): the number of distinct reads
+# (data URI and parameters) whose result versions are tracked for the ETags
+# of their HTTP responses; the least recently read are forgotten beyond it;
+# and the roles of the users that may read via the bridge.
+BRIDGE_VERSIONS_SIZE = 1024
+BRIDGE_ROLES = [
+    "ljop",
+    "ljadmin"
+]
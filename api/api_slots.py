@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+
+"""
+This module provides a compact representation of slot tables (ex. the data
+of the "com.lojack.rtu.data.v1.general.slots" data URI) for the
+WAMP/WebSocket interface, and the views of them returned to callers.
+
+A slot table holds each slot as a fixed-width binary record (see SLOT_FIELDS
+in the api_rpc_config.py module) in a single array, instead of as a
+dictionary. Slices of a table share its array, so a range of slots can be
+returned without copying or converting the rest of the table. Slots whose
+fields do not match SLOT_FIELDS exactly are left as they are (a list of
+dictionaries).
+
+The "read" procedures accept view parameters, which select the part of a
+slot table returned and its format; results are cached without regard to
+them (see api_rpc.py module):
+
+    offset
+        Index of the first slot returned (default 0).
+    count
+        Number of slots returned (default all remaining).
+    format
+        "json" (the default): a list of dictionaries, one per slot.
+        "binary": a dictionary with the "fields" of each record (as [name,
+            struct format character] pairs, little-endian, unpadded), the
+            "count" of records and the "records" themselves, as bytes; only
+            for callers using the MessagePack serializer (see check_format),
+            since the other serializers cannot carry bytes.
+        "base64": as "binary", with the records base64-encoded (for clients
+            using the JSON serializer).
+
+Example subsequent RPC procedure argument:
+    {"uri": "com.lojack.rtu.data.v1.general.slots",
+     "offset": 100,
+     "count": 50,
+     "format": "binary"}
+
+Exports:
+    SlotTable
+        Array-backed table of fixed-width slot records.
+    VIEW_PARAMS
+        Procedure data properties selecting the view of a slot table.
+    check_format
+        Ensure that a caller's serializer can carry the format requested.
+    view
+        Return the view of a result's slot tables requested by the caller.
+"""
+
+from __future__ import unicode_literals
+
+# System modules.
+import base64
+import struct
+
+# WAMP-related modules.
+from autobahn.wamp.exception import ApplicationError
+
+
+# Procedure data properties selecting the view of a slot table (see the
+# module documentation).
+VIEW_PARAMS = ("offset", "count", "format")
+
+# Formats in which slot tables can be returned.
+FORMATS = ("json", "binary", "base64")
+
+# WAMP subprotocols (ex. of a WebSocket transport) whose serializer can carry
+# the records of the "binary" format.
+BINARY_PROTOCOLS = ("wamp.2.msgpack", "wamp.2.msgpack.batched")
+
+# Python types accepted for each kind of struct format character; values of
+# other types cannot be stored (exactly) in a record.
+_FIELD_TYPES = {
+    "?": (bool,),
+    "d": (float,),
+    "f": (float,)}
+_INTEGER_TYPES = (int, long)
+
+
+class SlotTable(object):
+
+    """
+    Table of slots, each stored as a fixed-width record of the specified
+    fields ([name, struct format character] pairs) in the specified array
+    (a bytearray); the table may be a slice of the array's records, starting
+    at the specified record index.
+    """
+
+    def __init__(self, fields, records, start = 0, count = None):
+        # Field names and format characters are kept as text, so that the
+        # MessagePack serializer does not serialize them as bytes.
+        self.fields = [[unicode(name), unicode(code)] for name, code in fields]
+        self._names = [name for name, code in self.fields]
+        self._record = \
+            struct.Struct(
+                str("<" + "".join(code for name, code in fields)))
+        self._records = records
+        self._start = start
+        self._count = \
+            count if count is not None \
+            else len(records) // self._record.size - start
+
+    @classmethod
+    def from_slots(cls, fields, slots):
+        """
+        Return a table of the specified slots (a list of dictionaries), or
+        None if they cannot be stored exactly: each must have exactly the
+        specified fields, with values of the types of their formats.
+        """
+        table = cls(fields, bytearray())
+        names = set(table._names)
+        records = bytearray(table._record.size * len(slots))
+        for i, slot in enumerate(slots):
+            if not isinstance(slot, dict) or set(slot) != names:
+                return None
+            values = []
+            for name, code in fields:
+                value = slot[name]
+                types = _FIELD_TYPES.get(code, _INTEGER_TYPES)
+                if not isinstance(value, types) or \
+                   (types is _INTEGER_TYPES and isinstance(value, bool)):
+                    return None
+                values.append(value)
+            try:
+                table._record.pack_into(
+                    records,
+                    i * table._record.size,
+                    *values)
+            except struct.error:
+                return None
+        return cls(fields, records)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("slot index out of range")
+        return dict(
+            zip(
+                self._names,
+                self._record.unpack_from(
+                    self._records,
+                    (self._start + index) * self._record.size)))
+
+    def __iter__(self):
+        for index in xrange(self._count):
+            yield self[index]
+
+    def slice(self, offset, count = None):
+        """
+        Return a table of (at most) the specified number of slots (all
+        remaining slots if None) from the specified slot index on, sharing
+        this table's array.
+        """
+        offset = min(offset, self._count)
+        if count is None:
+            count = self._count - offset
+        return SlotTable(
+                   self.fields,
+                   self._records,
+                   self._start + offset,
+                   min(count, self._count - offset))
+
+    def to_list(self):
+        """
+        Return the table's slots as a list of dictionaries.
+        """
+        return list(self)
+
+    def to_bytes(self):
+        """
+        Return the table's records as bytes.
+        """
+        return bytes(
+                   self._records[
+                       self._start * self._record.size:
+                       (self._start + self._count) * self._record.size])
+
+
+def _get_view_param(data, name, default):
+    value = data.get(name, default)
+    if value is None:
+        return default
+    if name == "format":
+        if value not in FORMATS:
+            raise ApplicationError(
+                      "com.lojack.rtu.error.rpc_data_invalid",
+                      "The 'format' property must be one of: {}".format(
+                          ", ".join(FORMATS)))
+    elif not isinstance(value, _INTEGER_TYPES) or \
+         isinstance(value, bool) or \
+         value < 0:
+        raise ApplicationError(
+                  "com.lojack.rtu.error.rpc_data_invalid",
+                  "The '{}' property must be a non-negative integer".format(
+                      name))
+    return value
+
+def _view_table(table, offset, count, format):
+    if isinstance(table, list):
+        if format != "json":
+            raise ApplicationError(
+                      "com.lojack.rtu.error.rpc_data_invalid",
+                      "The slots cannot be returned in '{}' format".format(
+                          format))
+        return table[offset:offset + count if count is not None else None]
+    table = table.slice(offset, count)
+    if format == "json":
+        return table.to_list()
+    records = table.to_bytes()
+    return {
+        "fields": table.fields,
+        "count": len(table),
+        "records":
+            base64.b64encode(records).decode("ascii")
+                if format == "base64"
+                else records}
+
+def check_format(data, transport):
+    """
+    Raise an error if the specified procedure data (or that of any of the
+    reads of a "read_many" procedure) requests the "binary" format, unless
+    the specified caller transport information (as disclosed by the WAMP
+    router) shows that the caller uses the MessagePack serializer.
+    """
+    if not isinstance(data, dict):
+        return
+    if isinstance(transport, dict) and \
+       transport.get("protocol") in BINARY_PROTOCOLS:
+        return
+    for data_item in data["uris"] if isinstance(data.get("uris"), list) \
+                                   else [data]:
+        if isinstance(data_item, dict) and data_item.get("format") == "binary":
+            raise ApplicationError(
+                      "com.lojack.rtu.error.rpc_data_invalid",
+                      "The 'binary' format requires the MessagePack "
+                          "serializer; use the 'base64' format instead")
+
+def view(result, data):
+    """
+    Return the view of the specified result's slot tables (its "data"
+    property, if a slot table, or a list if view parameters were specified)
+    requested by the view parameters of the specified procedure data. The
+    result itself (ex. as cached) is not modified.
+    """
+    if not isinstance(result, dict) or not isinstance(data, dict):
+        return result
+    table = result.get("data")
+    if not isinstance(table, SlotTable) and \
+       (not isinstance(table, list) or
+        not any(name in data for name in VIEW_PARAMS)):
+        return result
+    result = dict(result)
+    result["data"] = \
+        _view_table(
+            table,
+            _get_view_param(data, "offset", 0),
+            _get_view_param(data, "count", None),
+            _get_view_param(data, "format", "json"))
+    return result
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""
+This module provides sampled, end-to-end tracing of RPC invocations through
+the WAMP/WebSocket interface and the internal IPC interface. A trace ID is
+generated for a sampled proportion of RPC invocations (see api_rpc_config.py
+module) and carried with the invocation, including inside the IPC messages
+it sends; each part (span) of the invocation's processing is recorded, with
+its trace ID and timing, as a line of JSON in a local, rotating trace file
+(one per process, so that processes do not rotate each other's files). The
+spans of a slow invocation can then be reconstructed from its trace ID, from
+the files of all processes.
+
+Exports:
+    start
+        Start a trace, if sampled.
+    current
+        The trace ID of the RPC invocation being dispatched, if any.
+    record
+        Record a span of a trace.
+"""
+
+from __future__ import unicode_literals
+
+# System modules.
+import json
+import logging
+import logging.handlers
+import os
+import random
+
+# Local modules.
+import api_rpc_config
+
+
+# The trace ID of the RPC invocation being dispatched (None if it is not
+# being traced). Set while a data procedure is invoked, so that the
+# procedure (and the modules it uses, ex. api_ipc) can carry the trace ID
+# onwards.
+current = None
+
+# Logger writing the spans to the trace file (configured when the first span
+# is recorded).
+_log = None
+
+
+def start():
+    """
+    Return a new trace ID if a trace should be recorded (according to the
+    configured sample rate), or None.
+    """
+    if api_rpc_config.TRACE_SAMPLE_RATE <= 0 or \
+       random.random() >= api_rpc_config.TRACE_SAMPLE_RATE:
+        return None
+    return "{:016x}".format(random.getrandbits(64))
+
+def _get_log():
+    global _log
+    if _log is None:
+        _log = logging.getLogger(__name__)
+        _log.propagate = False
+        _log.setLevel(logging.INFO)
+        handler = \
+            logging.handlers.RotatingFileHandler(
+                api_rpc_config.TRACE_FILE.format(pid = os.getpid()),
+                maxBytes = api_rpc_config.TRACE_FILE_SIZE,
+                backupCount = api_rpc_config.TRACE_FILE_COUNT)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _log.addHandler(handler)
+    return _log
+
+def record(trace_id, span, start, end, **attributes):
+    """
+    Record the specified span of the specified trace, which started and ended
+    at the specified times, with the specified (JSON-serializable)
+    attributes. Does nothing if the trace ID is None.
+    """
+    if trace_id is None:
+        return
+    attributes.update({
+        "trace_id": trace_id,
+        "span": span,
+        "start": start,
+        "duration": end - start})
+    _get_log().info(json.dumps(attributes, sort_keys = True))
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+"""
+This module provides the scale-out of the WAMP/WebSocket interface's RPC
+procedures across several worker processes (WAMP router container workers;
+see the router configuration file, .crossbar/config.json), so that their
+invocations are not limited to the WAMP router's single process (and CPU
+core).
+
+Each worker process runs a Worker component, which registers the RPC
+procedures (see api_rpc.py module) under URIs specific to the worker, with
+their own result caches and IPC client connection, and announces itself once
+they are registered (and again whenever the application component asks, ex.
+once it restarts). Workers join the realm through their own transport, with
+WAMP-CRA authentication (the credentials are passed to the component by the
+router configuration, as "authid" and "secret" extra), and only announce
+themselves (the announcement discloses the publisher, which must be the
+announced worker). The application component in the WAMP router (see
+api_app.py module) registers the RPC procedures under their usual URIs and
+forwards each invocation to one of the announced workers, chosen by the
+configured policy (see api_rpc_config.py module); invocations are processed in
+the WAMP router itself while no worker is available.
+
+Invocations are forwarded with the ID of their caller's session ("caller"),
+and each worker registers a cancel procedure, which the application component
+invokes (with the caller's session ID) when a caller leaves, so that the
+worker cancels the caller's invocations (and the IPC requests they made).
+
+Example worker procedure URIs:
+    "com.lojack.rtu.worker.1234.proc.v1.read"
+    "com.lojack.rtu.worker.1234.cancel"
+
+Exports:
+    Worker
+        WAMP application component class run in each worker process.
+    Workers
+        Set of available workers, chosen per invocation by policy.
+    proc_uri
+        Return the URI of a procedure registered by a worker.
+    cancel_uri
+        Return the URI of a worker's cancel procedure.
+"""
+
+from __future__ import unicode_literals
+
+# System modules.
+import logging
+import random
+
+# WAMP-related modules.
+from autobahn.twisted.wamp import ApplicationSession
+from autobahn.wamp import auth
+from autobahn.wamp.types import PublishOptions
+from twisted.internet.defer import inlineCallbacks, maybeDeferred
+
+# Local modules.
+import api_ipc
+import api_rpc
+import api_rpc_config
+
+
+# Log the worker's messages to the WAMP router's log (as api_app.py does in
+# the WAMP router).
+logging.basicConfig(
+    level = api_rpc_config.LOG_LEVEL,
+    format = "%(name)s %(levelname)s: %(message)s")
+
+# Worker "Ready" Topic URI; published (with the worker's ID) by each worker
+# once its procedures are registered.
+TOPIC_URI_READY = \
+    ".".join([
+        api_rpc_config.WORKER_URI_PREFIX,
+        "topic",
+        "v1",
+        "ready"])
+
+# Worker "Discover" Topic URI; published by the application component to ask
+# the workers to announce themselves (again).
+TOPIC_URI_DISCOVER = \
+    ".".join([
+        api_rpc_config.WORKER_URI_PREFIX,
+        "topic",
+        "v1",
+        "discover"])
+
+
+def proc_uri(worker_id, uri):
+    """
+    Return the URI of the procedure registered by the specified worker for
+    the specified RPC procedure URI.
+    """
+    return ".".join([
+               api_rpc_config.WORKER_URI_PREFIX,
+               str(worker_id),
+               "proc",
+               uri[len(api_rpc_config.PROC_URI_PREFIX) + 1:]])
+
+def cancel_uri(worker_id):
+    """
+    Return the URI of the specified worker's cancel procedure.
+    """
+    return ".".join([
+               api_rpc_config.WORKER_URI_PREFIX,
+               str(worker_id),
+               "cancel"])
+
+
+class Workers(object):
+
+    """
+    Set of available workers, by worker ID, one of which is chosen for each
+    invocation according to the specified policy: "roundrobin" (each worker
+    in turn) or "random".
+    """
+
+    def __init__(self, policy):
+        if policy not in ("roundrobin", "random"):
+            raise ValueError(
+                      "Unsupported worker policy '{}'".format(policy))
+        self.policy = policy
+        self._workers = []
+        self._next = 0
+
+    def __len__(self):
+        return len(self._workers)
+
+    def __iter__(self):
+        return iter(list(self._workers))
+
+    def add(self, worker_id):
+        if worker_id not in self._workers:
+            self._workers.append(worker_id)
+
+    def remove(self, worker_id):
+        if worker_id in self._workers:
+            self._workers.remove(worker_id)
+
+    def choose(self, key = None):
+        """
+        Return the ID of the worker to invoke next, or None if there are no
+        workers. If a key (ex. a data URI) is specified, the same worker is
+        chosen for the key as long as the workers do not change.
+        """
+        if len(self._workers) == 0:
+            return None
+        if key is not None:
+            return self._workers[hash(key) % len(self._workers)]
+        if self.policy == "random":
+            return random.choice(self._workers)
+        worker_id = self._workers[self._next % len(self._workers)]
+        self._next = (self._next + 1) % len(self._workers)
+        return worker_id
+
+
+class Worker(ApplicationSession):
+
+    """
+    Extend the WAMP application component class to register the application's
+    RPC procedures under this worker's URIs, and to announce the worker to
+    the application component forwarding invocations to it.
+    """
+
+    def onConnect(self):
+        """
+        Invoked once the worker component's transport is connected; joins the
+        realm with the configured credentials.
+        """
+        self.join(
+            self.config.realm,
+            ["wampcra"],
+            self.config.extra["authid"])
+
+    def onChallenge(self, challenge):
+        return auth.compute_wcs(
+                   self.config.extra["secret"].encode("utf8"),
+                   challenge.extra["challenge"].encode("utf8")).decode(
+                       "ascii")
+
+    @inlineCallbacks
+    def onJoin(self, details):
+        """
+        Invoked after the worker component joins its configured realm.
+        """
+        # Each worker has its own connection to the internal IPC interface
+        # (see api_ipc.py module); responses are routed back to it.
+        api_ipc.start()
+        # Discard cached results as the rest of the system notifies changes
+        # to their data (their publication is left to the WAMP router).
+        api_ipc.listen(lambda data_uri, result: api_rpc.invalidate(data_uri))
+        api_rpc.preload()
+        # Track the invocations in progress by caller session ID, to cancel
+        # them if the caller leaves.
+        self._calls = {}
+        yield self.register(self._cancel, cancel_uri(details.session))
+        yield api_rpc.register(
+                  self,
+                  [(proc_uri(details.session, proc["uri"]),
+                    self._make_proc(proc["proc"]))
+                       for proc in api_rpc.PROCS],
+                  {"details_arg": "details"},
+                  ".".join([
+                      api_rpc_config.WORKER_URI_PREFIX,
+                      str(details.session),
+                      "proc"]))
+        print(
+            "Worker {} registered {} procedures".format(
+                details.session,
+                len(api_rpc.PROCS)))
+        yield self.subscribe(self._announce, TOPIC_URI_DISCOVER)
+        self._announce()
+
+    def _make_proc(self, proc):
+        """
+        Return a procedure invoking the specified RPC procedure and tracking
+        the invocation by its caller's session ID (if forwarded).
+        """
+        def _proc_tracked(data, caller = None, details = None):
+            d = maybeDeferred(proc, data, details)
+            if caller is not None:
+                calls = self._calls.setdefault(caller, set())
+                calls.add(d)
+
+                def completed(result):
+                    calls.discard(d)
+                    if len(calls) == 0 and self._calls.get(caller) is calls:
+                        del self._calls[caller]
+                    return result
+
+                d.addBoth(completed)
+            return d
+        return _proc_tracked
+
+    def _cancel(self, caller):
+        # Cancel the invocations of the caller that left (see the
+        # application component's _session_left).
+        for d in list(self._calls.pop(caller, ())):
+            d.cancel()
+
+    def _announce(self):
+        self.publish(
+            TOPIC_URI_READY,
+            self._session_id,
+            options = PublishOptions(discloseMe = True))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+"""
+This module provides application configuration support for the
+WAMP/WebSocket interface.
+"""
+
+from __future__ import unicode_literals
+
+# System modules.
+import logging
+
+# WAMP-related modules.
+from autobahn.wamp.exception import ApplicationError
+
+# Local modules.
+import api_ipc
+
+
+log = logging.getLogger(__name__)
+
+def data_v1_proc_v1_read(request, details):
+    """
+    Read and return some or all of the application configuration (depending
+    on what was requested).
+    """
+    log.debug("Invoking api_ipc.request, request: %s", request)
+    return api_ipc.request(
+               dict(request, action = "read"),
+               None,
+               getattr(details, "deadline", None))
+
+def data_v1_proc_v1_update(request, details):
+    """
+    Update the application configuration fields specified by the request's
+    "data" property, and return the outcome.
+    """
+    if not isinstance(request.get("data"), dict):
+        raise ApplicationError(
+                  "com.lojack.rtu.error.rpc_data_invalid",
+                  "Updates must specify a dictionary with a 'data' property "
+                      "specifying the fields to update")
+    log.debug("Invoking api_ipc.request, request: %s", request)
+    return api_ipc.request(
+               dict(request, action = "update"),
+               None,
+               getattr(details, "deadline", None))
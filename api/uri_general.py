@@ -5,14 +5,105 @@ This module provides general system information support for the
 WAMP/WebSocket interface.
 """
 
+# System modules.
+import logging
+
+# WAMP-related modules.
+from autobahn.wamp.exception import ApplicationError
+from twisted.internet.defer import maybeDeferred
+
 # Local modules.
 import api_ipc
+import api_rpc_config
+import api_slots
+
+
+log = logging.getLogger(__name__)
+
+def _compact(result):
+    """
+    Store the slots in the specified result (if any) as a compact slot table
+    (see api_slots.py module), if possible.
+    """
+    if isinstance(result, dict) and \
+       result.get("sub") == "slots" and \
+       isinstance(result.get("data"), list):
+        table = \
+            api_slots.SlotTable.from_slots(
+                api_rpc_config.SLOT_FIELDS,
+                result["data"])
+        if table is not None:
+            result["data"] = table
+    return result
+
+def _get_sites(request):
+    """
+    Return the site IDs named by the specified request's "sites" property (a
+    list of site IDs, or "*" for all sites), or None if it has none.
+    """
+    sites = request.get("sites")
+    if sites is None or sites == "*":
+        return sites
+    if not isinstance(sites, list) or \
+       len(sites) == 0 or \
+       not all(isinstance(site_id, basestring) for site_id in sites):
+        raise ApplicationError(
+                  "com.lojack.rtu.error.rpc_data_invalid",
+                  "The 'sites' property must be a non-empty list of site IDs, "
+                      "or '*'")
+    return sites
 
 def data_v1_proc_v1_read(request, details):
     """
     Read and return some or all of the general application information
-    (depending on what was requested).
+    (depending on what was requested). Large information (ex. slots) may be
+    returned in parts, as in-progress results, if the caller requested them.
+
+    If the request has a "sites" property, the information is read from each
+    of the sites named (see the api_ipc.request_sites function) instead, and
+    returned by site ID, with the error of each site that failed; in-progress
+    results are not returned.
+
+    Example subsequent RPC procedure argument:
+        {"uri": "com.lojack.rtu.data.v1.general.slots", "sites": ["XX", "YY"]}
     """
-    print "Invoking api_ipc.Request().process, request:", request
-    return api_ipc.Request().process(request)
+    sites = _get_sites(request)
+    if sites is not None:
+        request = dict(request)
+        del request["sites"]
+        log.debug("Invoking api_ipc.request_sites, request: %s, sites: %s",
+                  request, sites)
+        return api_ipc.request_sites(
+                   request,
+                   sites,
+                   getattr(details, "deadline", None))
+    log.debug("Invoking api_ipc.request, request: %s", request)
+    return api_ipc.request(
+               request,
+               details.progress if details is not None else None,
+               getattr(details, "deadline", None)).addCallback(_compact)
 
+def data_v1_proc_v1_read_many(requests, details):
+    """
+    Read and return some or all of the general application information for
+    each of several requests, combining them into as few IPC requests as
+    possible. Requests with a "sites" property are read from the sites named,
+    as data_v1_proc_v1_read would.
+    """
+    results = [None] * len(requests)
+    batch = []
+    for index, request in enumerate(requests):
+        if request.get("sites") is not None:
+            results[index] = \
+                maybeDeferred(data_v1_proc_v1_read, request, details)
+        else:
+            batch.append(index)
+    log.debug("Invoking api_ipc.request_many, requests: %s",
+              [requests[index] for index in batch])
+    for index, d in zip(
+                        batch,
+                        api_ipc.request_many(
+                            [requests[index] for index in batch],
+                            getattr(details, "deadline", None))):
+        results[index] = d.addCallback(_compact)
+    return results
@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+
+"""
+This module benchmarks the WAMP/WebSocket interface's RPC -> IPC pipeline:
+from the RPC procedures created by the api_rpc module, through the data
+procedures (ex. uri_general) and the api_ipc client, to the api_ipc server
+and back. It runs in a single process, with no network: the WAMP router is
+replaced by a local stand-in that routes calls and events between sessions
+within the process, and the api_ipc.Server component stands in for the rest
+of the system (as it does in the router).
+
+Results are written as JSON (to standard output, or to the file specified by
+--output), so that the results of successive versions can be compared.
+
+Usage:
+    python bench/bench_api.py [--requests N] [--concurrency C [C ...]]
+                              [--long-run N] [--output FILE]
+
+Benchmarks:
+    dispatch
+        Cost of an RPC procedure invocation served from the result cache
+        (dispatch table lookup, result cache lookup).
+    round_trip
+        Latency (p50/p99) of sequential RPC reads that go through the IPC
+        client and server.
+    throughput
+        Reads per second, and their latency, at increasing numbers of
+        concurrent reads.
+    memory
+        Growth of the process's memory and of the number of live objects
+        over a long run of reads.
+    serializers
+        Encode and decode time and encoded size of representative IPC
+        messages and results (including a slot table in the binary format;
+        see api_slots.py module), under each available WAMP serializer, and
+        whether each round-trips unchanged.
+"""
+
+from __future__ import unicode_literals
+
+# System modules.
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from timeit import default_timer as timer
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        os.pardir,
+        "api"))
+
+# WAMP-related modules.
+from autobahn.wamp import serializer
+from autobahn.wamp.types import ComponentConfig
+from twisted.internet import reactor, task
+from twisted.internet.defer import \
+    Deferred, DeferredList, inlineCallbacks, maybeDeferred, returnValue
+
+# Local modules.
+import api_ipc
+import api_ipc_config
+import api_rpc
+import api_rpc_config
+import api_slots
+
+
+class _Registration(object):
+
+    def __init__(self, id):
+        self.id = id
+
+
+class LocalRouter(object):
+
+    """
+    Stand-in for the WAMP router: routes calls to registered procedures and
+    events to subscribers, within the process. Calls and events are delivered
+    on a later turn of the reactor, as they would be by a router.
+    """
+
+    def __init__(self):
+        self.procs = {}
+        self.subscribers = {}
+
+    def register(self, proc, uri):
+        self.procs[uri] = proc
+        return _Registration(len(self.procs))
+
+    def subscribe(self, handler, uri):
+        self.subscribers.setdefault(uri, []).append(handler)
+        return _Registration(len(self.subscribers))
+
+    def call(self, uri, *args):
+        d = Deferred()
+        reactor.callLater(
+            0,
+            lambda: maybeDeferred(self.procs[uri], *args).chainDeferred(d))
+        return d
+
+    def publish(self, uri, *args):
+        for handler in self.subscribers.get(uri, []):
+            reactor.callLater(0, handler, *args)
+
+
+class LocalSession:
+
+    """
+    Mixin replacing a WAMP application session's interaction with the router
+    by the local router stand-in (config.extra["router"]).
+    """
+
+    def register(self, proc, uri, options = None):
+        return maybeDeferred(
+                   self.config.extra["router"].register,
+                   proc,
+                   uri)
+
+    def subscribe(self, handler, uri, options = None):
+        return maybeDeferred(
+                   self.config.extra["router"].subscribe,
+                   handler,
+                   uri)
+
+    def call(self, uri, *args):
+        return self.config.extra["router"].call(uri, *args)
+
+    def publish(self, uri, *args, **kwargs):
+        self.config.extra["router"].publish(uri, *args)
+
+
+class LocalServer(LocalSession, api_ipc.Server):
+    pass
+
+
+class LocalClient(LocalSession, api_ipc.Client):
+    pass
+
+
+def start_local_ipc():
+    """
+    Start the api_ipc server and shared client connection on a local router
+    stand-in.
+    """
+    router = LocalRouter()
+    LocalServer(
+        ComponentConfig(
+            api_ipc_config.REALM,
+            {"router": router})).onJoin(None)
+    connection = \
+        api_ipc.Connection(
+            api_ipc_config.REALM,
+            api_ipc_config.ENDPOINT,
+            api_ipc_config.URL)
+    LocalClient(
+        ComponentConfig(
+            api_ipc_config.REALM,
+            {"router": router,
+             "connection": connection})).onJoin(None)
+    api_ipc._connection = connection
+    return connection
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def latency_stats(latencies):
+    return {
+        "p50_us": percentile(latencies, 0.50) * 1e6,
+        "p99_us": percentile(latencies, 0.99) * 1e6,
+        "max_us": max(latencies) * 1e6}
+
+
+def uncached_read(i):
+    """
+    Return a read request for a data URI that is not served from the result
+    cache (each request's parameters differ).
+    """
+    return api_rpc.v1_read(
+               {"uri": ".".join([
+                           api_rpc_config.DATA_URI_PREFIX,
+                           "v1",
+                           "general",
+                           "slots"]),
+                "bench_request": i})
+
+
+@inlineCallbacks
+def bench_dispatch(requests):
+    data = {
+        "uri": ".".join([
+                   api_rpc_config.DATA_URI_PREFIX,
+                   "v1",
+                   "general",
+                   "site_id"])}
+    yield api_rpc.v1_read(data)
+    start = timer()
+    for i in xrange(requests):
+        api_rpc.v1_read(data)
+    elapsed = timer() - start
+    returnValue({
+        "requests": requests,
+        "per_request_us": elapsed / requests * 1e6,
+        "requests_per_second": requests / elapsed})
+
+
+@inlineCallbacks
+def bench_round_trip(requests):
+    latencies = []
+    for i in xrange(requests):
+        start = timer()
+        yield uncached_read(i)
+        latencies.append(timer() - start)
+    result = latency_stats(latencies)
+    result["requests"] = requests
+    returnValue(result)
+
+
+@inlineCallbacks
+def bench_throughput(requests, concurrency):
+    latencies = []
+    issued = [0]
+
+    @inlineCallbacks
+    def worker():
+        while issued[0] < requests:
+            issued[0] += 1
+            start = timer()
+            yield uncached_read(issued[0])
+            latencies.append(timer() - start)
+
+    start = timer()
+    yield DeferredList([worker() for i in xrange(concurrency)])
+    elapsed = timer() - start
+    result = latency_stats(latencies)
+    result.update({
+        "concurrency": concurrency,
+        "requests": requests,
+        "requests_per_second": requests / elapsed})
+    returnValue(result)
+
+
+@inlineCallbacks
+def bench_memory(requests, concurrency, connection):
+    gc.collect()
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    objects_start = len(gc.get_objects())
+    yield bench_throughput(requests, concurrency)
+    gc.collect()
+    returnValue({
+        "requests": requests,
+        "concurrency": concurrency,
+        "max_rss_growth_kb":
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_start,
+        "object_growth": len(gc.get_objects()) - objects_start,
+        "pending_requests": len(connection.pending)})
+
+
+def same(a, b):
+    """
+    Return whether the specified values are equal and of the same types
+    (text and bytes, for example, compare equal in Python 2).
+    """
+    if isinstance(a, dict):
+        return isinstance(b, dict) and \
+               len(a) == len(b) and \
+               all(same(key, key_b) and same(a[key], b[key_b])
+                       for key, key_b in zip(sorted(a), sorted(b)))
+    if isinstance(a, list):
+        return isinstance(b, list) and \
+               len(a) == len(b) and \
+               all(same(item, item_b) for item, item_b in zip(a, b))
+    return type(a) is type(b) and a == b
+
+
+def serializer_payloads(session):
+    """
+    Return representative payloads for the serializer benchmark, built by
+    the IPC client session: a request message, its processed response, a
+    batch request message and a large (slot table) response, as a list of
+    slots and in the binary and base64 formats.
+    """
+    data_uri = \
+        ".".join([
+            api_rpc_config.DATA_URI_PREFIX,
+            "v1",
+            "general",
+            "slots"])
+    resource_main, request = session._create_ipc_message({"uri": data_uri})
+    request["message"]["request_id"] = 4096
+    request["message"]["trace_id"] = "5080e0f64f95f58b"
+    response = \
+        session._process_ipc_message(
+            resource_main,
+            dict(request["message"]),
+            request["destination"])
+    batch = {
+        "destination": request["destination"],
+        "message": {
+            "source": request["message"]["source"],
+            "request_id": 4097,
+            "batch": [
+                session._create_ipc_message({"uri": data_uri})[1]["message"]
+                    for i in xrange(16)]}}
+    slots = dict(response)
+    slots["data"] = [
+        {"slot": i, "length": 1024, "value": i * 7919 % 65536}
+            for i in xrange(4096)]
+    slots_binary = dict(response)
+    slots_binary["data"] = \
+        api_slots.SlotTable.from_slots(
+            api_rpc_config.SLOT_FIELDS,
+            [{"slot": i,
+              "state": i % 4,
+              "occupied": i % 3 == 0,
+              "vehicle_id": i * 7919 % 65536,
+              "updated": 1400000000.0 + i}
+                 for i in xrange(4096)])
+    slots_base64 = api_slots.view(slots_binary, {"format": "base64"})
+    slots_binary = api_slots.view(slots_binary, {"format": "binary"})
+    return {
+        "request": request,
+        "response": response,
+        "batch": batch,
+        "slots": slots,
+        "slots_binary": slots_binary,
+        "slots_base64": slots_base64}
+
+
+def bench_serializers(session, requests):
+    payloads = serializer_payloads(session)
+    object_serializers = {"json": serializer.JsonObjectSerializer()}
+    if hasattr(serializer, "MsgPackObjectSerializer"):
+        object_serializers["msgpack"] = serializer.MsgPackObjectSerializer()
+    results = {}
+    for name, object_serializer in object_serializers.iteritems():
+        results[name] = {}
+        for payload_name, payload in payloads.iteritems():
+            repeats = max(1, requests // (1 + len(repr(payload)) // 1024))
+            try:
+                encoded = object_serializer.serialize(payload)
+            except Exception:
+                # The serializer cannot encode the payload (ex. bytes, under
+                # JSON).
+                results[name][payload_name] = None
+                continue
+            start = timer()
+            for i in xrange(repeats):
+                object_serializer.serialize(payload)
+            encode = (timer() - start) / repeats
+            start = timer()
+            for i in xrange(repeats):
+                object_serializer.unserialize(encoded)
+            decode = (timer() - start) / repeats
+            results[name][payload_name] = {
+                "bytes": len(encoded),
+                "encode_us": encode * 1e6,
+                "decode_us": decode * 1e6,
+                "round_trip": same(
+                                  payload,
+                                  object_serializer.unserialize(encoded)[0])}
+    return results
+
+
+@inlineCallbacks
+def main(reactor, args):
+    output = sys.stdout
+    # Discard the components' console output, which would otherwise be mixed
+    # with the results.
+    sys.stdout = open(os.devnull, "w")
+    try:
+        connection = start_local_ipc()
+        results = {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dispatch": (yield bench_dispatch(args.requests)),
+            "round_trip": (yield bench_round_trip(args.requests)),
+            "throughput": [],
+            "memory": None,
+            "serializers": bench_serializers(
+                               connection.session,
+                               args.requests)}
+        for concurrency in args.concurrency:
+            results["throughput"].append(
+                (yield bench_throughput(args.requests, concurrency)))
+        results["memory"] = \
+            yield bench_memory(
+                      args.long_run,
+                      max(args.concurrency),
+                      connection)
+    finally:
+        sys.stdout = output
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 2, sort_keys = True)
+    else:
+        json.dump(results, sys.stdout, indent = 2, sort_keys = True)
+        print
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                 description = "Benchmark the RPC -> IPC pipeline.")
+    parser.add_argument(
+        "--requests",
+        type = int,
+        default = 5000,
+        help = "number of requests per benchmark")
+    parser.add_argument(
+        "--concurrency",
+        type = int,
+        nargs = "+",
+        default = [1, 8, 64, 256],
+        help = "numbers of concurrent requests for the throughput benchmark")
+    parser.add_argument(
+        "--long-run",
+        type = int,
+        default = 50000,
+        help = "number of requests for the memory benchmark")
+    parser.add_argument(
+        "--output",
+        help = "file to write the JSON results to (default: standard output)")
+    task.react(main, [parser.parse_args()])
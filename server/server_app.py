@@ -1,4 +1,8 @@
-from flask import Flask, render_template
+import json
+
+from flask import Flask, abort, render_template, request
+
+import server_static
 
 app = Flask(__name__)
 
@@ -8,12 +12,115 @@ env = "development"
 
 app.config.from_object("server_config.Config" + env.capitalize())
 
+# Static files, precompressed once, by file name.
+assets = server_static.load_assets(app.static_folder, app.config)
+
+# Rendered index pages, by role context.
+index_assets = {}
+
+@app.url_defaults
+def static_version(endpoint, values):
+    # Version static file URLs by content hash, so that they can be cached
+    # for long.
+    if endpoint == "static" and values.get("filename") in assets:
+        values.setdefault("v", assets[values["filename"]].hash[:12])
+
+def static(filename):
+    if filename not in assets:
+        abort(404)
+    return assets[filename].response(
+               app.response_class,
+               app.config["STATIC_MAX_AGE"])
+
+app.view_functions["static"] = static
+
 @app.route("/")
 def index():
-    return render_template(
-            "index.html",
-            ctx={
-                "realm": "XX",
-                "roles": ["ljop", "ljadmin"],
-                "role": "ljadmin",
-                "role_default": "ljop"})
+    ctx = {
+        "realm": "XX",
+        "roles": ["ljop", "ljadmin"],
+        "role": "ljadmin",
+        "role_default": "ljop"}
+    key = (ctx["realm"], tuple(ctx["roles"]), ctx["role"], ctx["role_default"])
+    if key not in index_assets:
+        index_assets[key] = \
+            server_static.Asset(
+                render_template("index.html", ctx = ctx).encode("utf-8"),
+                "text/html",
+                app.config)
+    # The index itself is not versioned; clients revalidate it (by ETag).
+    return index_assets[key].response(app.response_class, 0)
+
+def query_value(value):
+    # Query parameter values are JSON (ex. offset=10, sites=["XX","YY"]), or
+    # else strings (ex. sites=*).
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+def json_response(data, status = 200):
+    return app.response_class(
+               json.dumps(data),
+               status = status,
+               mimetype = "application/json")
+
+def bridge():
+    # The read bridge (see the api_bridge module) is only available within
+    # the WAMP router; the app itself only requires Flask.
+    try:
+        import api_bridge
+    except ImportError:
+        return None
+    return api_bridge
+
+def bridge_error(e, status):
+    # Respond with a bridge (procedure) error; its HTTP status is configured,
+    # or else the one specified. Authentication failures ask for (HTTP Basic)
+    # credentials.
+    status = app.config["BRIDGE_ERROR_STATUS"].get(e.error, status)
+    response = json_response(
+                   {"error": e.error, "message": (e.args or [""])[0]},
+                   status)
+    if status == 401:
+        response.www_authenticate.set_basic(app.config["BRIDGE_AUTH_REALM"])
+    return response
+
+@app.route("/data/<version>/<path:name>")
+def data(version, name):
+    # Read a data URI (ex. /data/v1/general/site_id) via the "read" procedure;
+    # query parameters are procedure data. Clients authenticate as a WAMP
+    # user (with HTTP Basic authentication).
+    api_bridge = bridge()
+    if api_bridge is None:
+        return json_response(
+                   {"error": "com.lojack.rtu.error.bridge_unavailable",
+                    "message": "The HTTP read bridge is not available"},
+                   503)
+    auth = request.authorization
+    try:
+        if auth is None or auth.type != "basic":
+            raise api_bridge.ApplicationError(
+                      "com.lojack.rtu.error.bridge_not_authenticated",
+                      "HTTP reads require credentials")
+        api_bridge.authenticate(auth.username, auth.password)
+    except api_bridge.ApplicationError as e:
+        return bridge_error(e, 401)
+    proc_data = dict(
+        (key, query_value(value)) for key, value in request.args.iteritems())
+    if proc_data.get("format") == "binary":
+        abort(400)
+    proc_data["uri"] = api_bridge.get_data_uri(version, name)
+    try:
+        etag, result = api_bridge.read(proc_data)
+    except api_bridge.ApplicationError as e:
+        return bridge_error(e, 502)
+    # Clients revalidate (by ETag, the result's version); unchanged results
+    # are not sent again.
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status = 304)
+    else:
+        response = json_response(result)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
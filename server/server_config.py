@@ -10,6 +10,29 @@ class Config(object):
         "text/html",
         "text/plain",
         "text/xml"]
+    # Compression level of the precompressed static files and pages, by
+    # encoding, and the minimum size of those compressed.
+    COMPRESS_LEVEL = {
+        "gzip": 9,
+        "br": 11}
+    COMPRESS_MIN_SIZE = 500
+    # Time (in seconds) for which clients may cache static files (whose URLs
+    # are versioned by content hash).
+    STATIC_MAX_AGE = 31536000
+    # Realm named to HTTP clients asked for credentials by the read bridge.
+    BRIDGE_AUTH_REALM = "XX"
+    # HTTP status of the read bridge's responses, by procedure error (others
+    # are 502, or 401 if authenticating).
+    BRIDGE_ERROR_STATUS = {
+        "com.lojack.rtu.error.bridge_not_authorized": 403,
+        "com.lojack.wamp.error.busy": 503,
+        "com.lojack.rtu.error.rpc_data_uri_missing": 400,
+        "com.lojack.rtu.error.rpc_data_invalid": 400,
+        "com.lojack.rtu.error.rpc_data_uri_unsupported": 404,
+        "com.lojack.rtu.error.rpc_not_implemented": 404,
+        "com.lojack.rtu.error.overloaded": 503,
+        "com.lojack.rtu.error.bridge_unavailable": 503,
+        "com.lojack.rtu.error.timeout": 504}
 
 class ConfigProduction(Config):
     DEBUG = False
@@ -0,0 +1,101 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from io import BytesIO
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Encodings in which responses can be served, in order of preference.
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def compress(data, encoding, level):
+    if encoding == "br":
+        return brotli.compress(data, quality = level)
+    out = BytesIO()
+    with gzip.GzipFile(fileobj = out, mode = "wb", compresslevel = level,
+                       mtime = 0) as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def accepted_encodings():
+    # Encodings accepted by the client (Accept-Encoding), except those with
+    # a zero quality value.
+    accepted = set()
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        params = item.strip().split(";")
+        if params[0] and not any(
+                param.strip() in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+                    for param in params[1:]):
+            accepted.add(params[0].strip().lower())
+    return accepted
+
+
+class Asset(object):
+
+    # An asset (ex. a static file, or a rendered page) held in memory, with
+    # its precompressed variants (if compressible) and a content-hash ETag.
+
+    def __init__(self, data, mimetype, config):
+        self.mimetype = mimetype
+        self.hash = hashlib.sha1(data).hexdigest()
+        self.variants = {None: data}
+        if mimetype in config["COMPRESS_MIMETYPES"] and \
+           len(data) >= config["COMPRESS_MIN_SIZE"] and \
+           (not config["DEBUG"] or config["COMPRESS_DEBUG"]):
+            for encoding in ENCODINGS:
+                compressed = \
+                    compress(
+                        data,
+                        encoding,
+                        config["COMPRESS_LEVEL"].get(encoding))
+                if len(compressed) < len(data):
+                    self.variants[encoding] = compressed
+
+    def response(self, response_class, max_age):
+        accepted = accepted_encodings()
+        encoding = next(
+            (encoding for encoding in ENCODINGS
+                 if encoding in self.variants and encoding in accepted),
+            None)
+        response = \
+            response_class(
+                self.variants[encoding],
+                mimetype = self.mimetype)
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+        if len(self.variants) > 1:
+            response.vary.add("Accept-Encoding")
+        # Each variant is a different representation, with its own ETag.
+        response.set_etag(
+            self.hash + ("-" + encoding if encoding is not None else ""))
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        return response.make_conditional(request)
+
+
+def load_assets(folder, config):
+    # Load all files in the specified folder (ex. the static folder) as
+    # assets, by file name relative to the folder (with "/" separators).
+    assets = {}
+    for root, dirs, files in os.walk(folder):
+        for name in files:
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, folder).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                data = f.read()
+            assets[filename] = \
+                Asset(
+                    data,
+                    mimetypes.guess_type(name)[0] or
+                        "application/octet-stream",
+                    config)
+    return assets